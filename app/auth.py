@@ -1,22 +1,76 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.cache import TTLCache
+from app.config import settings
+from app.database import get_async_db
+from app.events import event_bus, on_commit
+from app.metrics import metrics
 from app.models import User
-from app.schemas import TokenData
+from app.schemas import TokenClaims, TokenData, User as UserSchema
+from app.websocket_manager import manager
 
 # Security configuration
 SECRET_KEY = "your-secret-key-here"  # Change this in production!
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ACCESS_TOKEN_EXPIRE_MINUTES = 15
+REFRESH_TOKEN_EXPIRE_DAYS = 30
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Resolved users keyed by token subject, so hot clients skip the users table
+user_cache = TTLCache(
+    maxsize=settings.auth_cache_max_entries, ttl=settings.auth_cache_ttl_seconds
+)
+# Current token version per user id, checked on every request for revocation
+token_versions = TTLCache(
+    maxsize=settings.auth_cache_max_entries, ttl=settings.auth_cache_ttl_seconds
+)
+
+
+EVICT_TOPIC = "auth:evict"
+
+
+def _evict(user_names, user_id):
+    for user_name in user_names:
+        user_cache.pop(user_name)
+    token_versions.pop(user_id)
+
+
+def _evict_everywhere(user_names, user_id):
+    # Other workers drop their copies too, so a revocation applies everywhere
+    _evict(user_names, user_id)
+    event_bus.relay(EVICT_TOPIC, json.dumps([list(user_names), user_id]))
+
+
+manager.on_relay(EVICT_TOPIC, lambda message: _evict(*json.loads(message)))
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _evict_cached_user(mapper, connection, target):
+    # This runs at flush; evicting now would let a concurrent lookup cache
+    # the old row again before commit, and a rollback would evict for nothing
+    state = inspect(target)
+    user_names = (target.user_name, *state.attrs.user_name.history.deleted)
+    if state.session is None:
+        _evict_everywhere(user_names, target.id)
+    else:
+        on_commit(state.session, _evict_everywhere, user_names, target.id)
+
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -26,6 +80,72 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+class PasswordHashPool:
+    """Runs bcrypt work on a fixed number of threads with a bounded backlog.
+
+    Once ``max_pending`` jobs are queued or running, new work is refused with a
+    503 instead of piling up behind a login storm.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="password-hash"
+        )
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _finished(self):
+        with self._lock:
+            self._pending -= 1
+            metrics.set_gauge("password_pool.pending", self._pending)
+
+    def submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                metrics.incr("password_pool.rejected")
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Server busy, please retry",
+                    headers={"Retry-After": "1"},
+                )
+            self._pending += 1
+            metrics.set_gauge("password_pool.pending", self._pending)
+        queued_at = time.monotonic()
+
+        def run():
+            metrics.observe("password_pool.wait_seconds", time.monotonic() - queued_at)
+            try:
+                return fn(*args)
+            finally:
+                self._finished()
+
+        try:
+            return self._executor.submit(run)
+        except RuntimeError:
+            self._finished()
+            raise
+
+    async def run(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_pool = PasswordHashPool(
+    settings.password_hash_workers, settings.password_hash_max_pending
+)
+
+
+async def verify_password_async(plain_password, hashed_password):
+    return await password_pool.run(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password):
+    return await password_pool.run(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -37,24 +157,113 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
-):
-    credentials_exception = HTTPException(
+def create_user_tokens(user) -> dict:
+    """Issue a short-lived access token and a refresh token for ``user``.
+
+    The access token carries the user id, admin flag and token version, so
+    endpoints that only need those can authorize without loading the user.
+    """
+    claims = {"sub": user.user_name, "uid": user.id, "ver": user.token_version}
+    access_token = create_access_token(
+        {**claims, "adm": bool(user.is_admin), "typ": ACCESS_TOKEN_TYPE},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+    refresh_token = create_access_token(
+        {**claims, "typ": REFRESH_TOKEN_TYPE},
+        expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+    }
+
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def decode_token(token: str, token_type: str = ACCESS_TOKEN_TYPE) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_name: str = payload.get("sub")
-        if user_name is None:
-            raise credentials_exception
-        token_data = TokenData(user_name=user_name)
     except JWTError:
+        raise _credentials_exception()
+    # Tokens issued before typ existed are access tokens
+    if payload.get("typ", ACCESS_TOKEN_TYPE) != token_type:
+        raise _credentials_exception()
+    return payload
+
+
+def token_user_id(authorization: Optional[str]) -> Optional[int]:
+    """The user id in a valid bearer access token, else None. Never raises."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return decode_token(token).get("uid")
+    except HTTPException:
+        return None
+
+
+async def check_token_version(db: AsyncSession, user_id: int, version: int):
+    """Reject tokens issued before the user's last revocation."""
+    current = token_versions.get(user_id)
+    if current is None:
+        result = await db.execute(select(User.token_version).where(User.id == user_id))
+        current = result.scalar()
+        if current is None:
+            raise _credentials_exception()
+        token_versions.set(user_id, current)
+    if current != version:
+        raise _credentials_exception()
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
+):
+    credentials_exception = _credentials_exception()
+    payload = decode_token(token)
+    user_name: str = payload.get("sub")
+    if user_name is None:
         raise credentials_exception
-    user = db.query(User).filter(User.user_name == token_data.user_name).first()
-    if user is None:
+    # Tokens without a version could never be revoked
+    if "uid" not in payload or "ver" not in payload:
         raise credentials_exception
-    db.refresh(user)  # Refresh the user from the database
+    token_data = TokenData(user_name=user_name)
+    await check_token_version(db, payload["uid"], payload["ver"])
+    user = user_cache.get(token_data.user_name)
+    if user is not None:
+        return user
+    result = await db.execute(
+        select(User).where(User.user_name == token_data.user_name)
+    )
+    db_user = result.scalars().first()
+    if db_user is None:
+        raise credentials_exception
+    user = UserSchema.model_validate(db_user)
+    user_cache.set(token_data.user_name, user)
     return user
+
+
+async def get_token_claims(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
+) -> TokenClaims:
+    """Authorize from the token alone, for endpoints that only need the user id.
+
+    Only the per-user token version is checked, and that is usually cached.
+    Tokens without embedded claims are rejected.
+    """
+    payload = decode_token(token)
+    if "uid" not in payload or "ver" not in payload:
+        raise _credentials_exception()
+    await check_token_version(db, payload["uid"], payload["ver"])
+    return TokenClaims(
+        id=payload["uid"],
+        user_name=payload.get("sub"),
+        is_admin=payload.get("adm", False),
+        token_version=payload["ver"],
+    )
@@ -0,0 +1,157 @@
+import asyncio
+import itertools
+import json
+import os
+import secrets
+import socket
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+from app.cache import TTLCache
+from app.config import settings
+from app.metrics import metrics
+
+# Receivers call this with (topic, message) for publishes from other workers
+DeliverCallback = Callable[[str, str], object]
+
+MAX_DATAGRAM_SIZE = 64 * 1024
+
+
+class Backplane:
+    """Relays WebSocket publishes between worker processes.
+
+    ``publish`` is called after the message has already been delivered
+    locally and must not block; implementations hand remote messages to the
+    callback given to ``start``.
+    """
+
+    async def start(self, deliver: DeliverCallback):
+        pass
+
+    def publish(self, topic: str, message: str):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class LocalBackplane(Backplane):
+    """Single-process deployments: there is nobody to relay to."""
+
+
+class UnixSocketBackplane(Backplane):
+    """Peer-to-peer relay over Unix datagram sockets, no broker needed.
+
+    Every worker binds ``<directory>/<worker id>.sock`` and sends each publish
+    to the other sockets in the directory. Messages carry the sender's id and
+    a per-topic sequence number; receivers drop anything at or below the last
+    sequence seen from that sender on that topic, so each topic is delivered
+    once and in publish order per sender. A full peer buffer drops the
+    datagram rather than blocking; the receiver counts the gap.
+    """
+
+    def __init__(self, directory: str, peer_refresh_seconds: float = 1.0):
+        self.directory = directory
+        self.peer_refresh_seconds = peer_refresh_seconds
+        self.worker_id = f"{os.getpid()}-{secrets.token_hex(4)}"
+        self.path = os.path.join(directory, self.worker_id + ".sock")
+        self._sock: Optional[socket.socket] = None
+        self._deliver: Optional[DeliverCallback] = None
+        self._sequences: Dict[str, itertools.count] = {}
+        # Last sequence seen per (sender, topic); idle senders age out
+        self._last_seen = TTLCache(maxsize=100_000, ttl=3600)
+        self._peers: List[str] = []
+        self._peers_loaded_at = 0.0
+
+    async def start(self, deliver: DeliverCallback):
+        os.makedirs(self.directory, exist_ok=True)
+        self._deliver = deliver
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._sock.bind(self.path)
+        asyncio.get_running_loop().add_reader(self._sock.fileno(), self._receive)
+
+    async def stop(self):
+        if self._sock is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+        _unlink(self.path)
+
+    def publish(self, topic: str, message: str):
+        if self._sock is None:
+            return
+        sequence = self._sequences.setdefault(topic, itertools.count(1))
+        datagram = json.dumps(
+            {"o": self.worker_id, "s": next(sequence), "t": topic, "m": message},
+            separators=(",", ":"),
+        ).encode()
+        if len(datagram) > MAX_DATAGRAM_SIZE:
+            metrics.incr("backplane.oversized")
+            return
+        for peer in self._current_peers():
+            try:
+                self._sock.sendto(datagram, peer)
+            except BlockingIOError:
+                metrics.incr("backplane.send_dropped")
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The worker behind this socket is gone
+                _unlink(peer)
+                self._peers_loaded_at = 0.0
+        metrics.incr("backplane.published")
+
+    def _current_peers(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._peers_loaded_at > self.peer_refresh_seconds:
+            self._peers = [
+                os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if name.endswith(".sock") and name != self.worker_id + ".sock"
+            ]
+            self._peers_loaded_at = now
+        return self._peers
+
+    def _receive(self):
+        while self._sock is not None:
+            try:
+                datagram = self._sock.recv(MAX_DATAGRAM_SIZE)
+            except BlockingIOError:
+                return
+            try:
+                envelope = json.loads(datagram)
+                origin, sequence = envelope["o"], envelope["s"]
+                topic, message = envelope["t"], envelope["m"]
+            except (ValueError, KeyError, TypeError):
+                metrics.incr("backplane.malformed")
+                continue
+            self.handle(origin, sequence, topic, message)
+
+    def handle(self, origin: str, sequence: int, topic: str, message: str):
+        """Deliver one relayed message unless it is a duplicate or stale."""
+        key = (origin, topic)
+        last = self._last_seen.get(key, 0)
+        if sequence <= last:
+            metrics.incr("backplane.duplicates")
+            return
+        if sequence > last + 1 and last:
+            metrics.incr("backplane.gaps")
+        self._last_seen.set(key, sequence)
+        metrics.incr("backplane.received")
+        self._deliver(topic, message)
+
+
+def create_backplane() -> Backplane:
+    if settings.websocket_backplane == "unix":
+        directory = settings.websocket_backplane_dir or os.path.join(
+            tempfile.gettempdir(), "websocket-backplane"
+        )
+        return UnixSocketBackplane(directory)
+    return LocalBackplane()
+
+
+def _unlink(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
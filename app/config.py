@@ -1,15 +1,72 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
     app_name: str = "Flutter Multi-Platform API"
     debug: bool = True
-    database_url: str = "sqlite:///./sql_app.db"
+    # Defaults to data/social.db next to the app when unset
+    database_url: Optional[str] = None
+    # "production" applies the SQLite pragmas below on connect; "default" doesn't
+    database_profile: str = "production"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size_kib: int = 64 * 1024
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    # GET endpoints read from here; unset means a read-only SQLite connection
+    read_database_url: Optional[str] = None
+    read_your_writes_seconds: float = 5
     allowed_origins: List[str] = ["*"]
     max_upload_size: int = 10 * 1024 * 1024
     supported_platforms: List[str] = ["web", "mobile", "desktop"]
     upload_dir: str = "uploads"
+    # Changes and revocations are relayed to the other workers over the
+    # WebSocket backplane; a lost relay leaves a stale entry for up to the TTL
+    auth_cache_ttl_seconds: float = 60
+    auth_cache_max_entries: int = 10_000
+    password_hash_workers: int = 2
+    password_hash_max_pending: int = 32
+    # WebP copies generated for each uploaded image, never wider than the original
+    image_variant_widths: List[int] = [160, 320, 640, 1280]
+    image_variant_quality: int = 80
+    image_variant_workers: int = 1
+    # Failed renders are retried on lookup after this delay, doubled each
+    # time; past the last attempt the original is served
+    image_variant_retry_seconds: float = 5 * 60
+    image_variant_max_attempts: int = 3
+    # Resumable upload sessions idle this long are deleted by a periodic sweep
+    resumable_upload_ttl_seconds: float = 24 * 60 * 60
+    resumable_upload_gc_interval_seconds: float = 10 * 60
+    # Outbound messages buffered per socket; "disconnect" or "drop" when full
+    websocket_send_queue_size: int = 256
+    websocket_overflow_policy: str = "disconnect"
+    websocket_max_subscriptions: int = 100
+    # Sockets are pinged this often and closed after this long without a word
+    websocket_ping_interval_seconds: float = 20.0
+    websocket_idle_timeout_seconds: float = 60.0
+    websocket_max_connections_per_user: int = 5
+    # MessagePack sockets get everything queued within the window in one frame
+    websocket_batch_window_seconds: float = 0.005
+    websocket_batch_max_messages: int = 64
+    # "unix" relays publishes between workers on this host; "local" doesn't
+    websocket_backplane: str = "local"
+    websocket_backplane_dir: Optional[str] = None
+    # Like counts are pushed at most this often per post
+    like_event_interval_seconds: float = 1.0
+    # Serialized post and comment reads. Writes invalidate them in every
+    # worker through the WebSocket backplane, so run several workers with
+    # websocket_backplane="unix". The TTL bounds staleness when a relayed
+    # invalidation is lost or the read replica lags.
+    response_cache_max_bytes: int = 32 * 1024 * 1024
+    response_cache_ttl_seconds: float = 10.0
+    # Authors with more followers are pulled into timelines at read time
+    timeline_fanout_max_followers: int = 10_000
+    # Recent posts copied into a timeline when following someone, and into
+    # every follower's when an author falls back under the fan-out limit
+    timeline_backfill_posts: int = 20
 
     class Config:
         env_file = ".env"
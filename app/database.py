@@ -1,6 +1,15 @@
-from sqlalchemy import create_engine
+from functools import partial
+from typing import Optional
+from fastapi import Request
+from sqlalchemy import create_engine, event, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.cache import TTLCache
+from app.config import settings
 import os
 
 # Get the absolute path to the backend directory
@@ -11,19 +20,168 @@ DB_PATH = os.path.join(DATA_DIR, "social.db")
 # Create data directory if it doesn't exist
 os.makedirs(DATA_DIR, exist_ok=True)
 
-SQLALCHEMY_DATABASE_URL = os.getenv("TEST_DATABASE_URL", f"sqlite:///{DB_PATH}")
-
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+SQLALCHEMY_DATABASE_URL = (
+    os.getenv("TEST_DATABASE_URL") or settings.database_url or f"sqlite:///{DB_PATH}"
 )
+
+
+def _is_sqlite_file(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database not in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record, read_only=False):
+    """Production SQLite settings, applied to every new pooled connection.
+
+    WAL lets readers run alongside the single writer, busy_timeout makes
+    writers wait for the lock instead of failing with "database is locked",
+    and mmap/cache sizes keep hot pages out of read() syscalls.
+    """
+    cursor = dbapi_connection.cursor()
+    if not read_only:
+        # Switching journal mode writes to the file; the primary does it
+        cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+    cursor.execute(f"PRAGMA cache_size=-{int(settings.sqlite_cache_size_kib)}")
+    cursor.close()
+
+
+def _engine_options(url, is_async: bool = False) -> dict:
+    options = {}
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+    if url.get_backend_name() != "sqlite" or _is_sqlite_file(url):
+        options.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+        )
+        if is_async:
+            options["poolclass"] = AsyncAdaptedQueuePool
+    return options
+
+
+def create_db_engine(url: str, profile: str = None, read_only: bool = False):
+    url = make_url(url)
+    engine = create_engine(url, **_engine_options(url))
+    if (profile or settings.database_profile) == "production" and _is_sqlite_file(url):
+        event.listen(
+            engine, "connect", partial(apply_sqlite_pragmas, read_only=read_only)
+        )
+    return engine
+
+
+def _read_replica_url(url: str) -> Optional[str]:
+    """Where GET traffic goes: the configured replica, or a read-only
+    connection to the same SQLite file, or nothing (use the primary)."""
+    if settings.read_database_url:
+        return settings.read_database_url
+    parsed = make_url(url)
+    if not _is_sqlite_file(parsed) or parsed.query:
+        return None
+    path = os.path.abspath(parsed.database)
+    return f"sqlite:///file:{path}?mode=ro&uri=true"
+
+
+def create_async_db_engine(url: str, profile: str = None):
+    url = make_url(url)
+    if url.drivername == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    engine = create_async_engine(url, **_engine_options(url, is_async=True))
+    if (profile or settings.database_profile) == "production" and _is_sqlite_file(url):
+        event.listen(engine.sync_engine, "connect", apply_sqlite_pragmas)
+    return engine
+
+
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+READ_DATABASE_URL = _read_replica_url(SQLALCHEMY_DATABASE_URL)
+read_engine = (
+    create_db_engine(READ_DATABASE_URL, read_only=True) if READ_DATABASE_URL else engine
+)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# Clients that wrote recently read from the primary until the replica catches up
+recent_writers = TTLCache(
+    maxsize=settings.auth_cache_max_entries, ttl=settings.read_your_writes_seconds
+)
+
+# Async endpoints and dependencies use this so queries don't block the loop
+async_engine = create_async_db_engine(SQLALCHEMY_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
 
+def upsert_insert(db, table):
+    """An ``INSERT`` for ``table`` in ``db``'s dialect, which adds
+    ``on_conflict_do_nothing``/``on_conflict_do_update``. Only SQLite and
+    PostgreSQL have them."""
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"Upserts are not supported on {dialect}")
+
+
+def bump_counter(db, model, row_id: int, column, delta: int) -> Optional[int]:
+    """Adjust a denormalized counter in SQL so concurrent writers don't race,
+    returning the new value, or None when the row is gone."""
+    # Assigning updated_at to itself keeps its onupdate from firing
+    return db.execute(
+        update(model)
+        .where(model.id == row_id)
+        .values({column: column + delta, model.updated_at: model.updated_at})
+        .returning(column)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def _sticky_key(request: Request) -> Optional[int]:
+    # The token's user id, set by middleware, so a refreshed token still
+    # sees its own writes and bogus headers can't fill the cache
+    return getattr(request.state, "user_id", None)
+
+
+def mark_recent_write(request: Request):
+    key = _sticky_key(request)
+    if key is not None:
+        recent_writers.set(key, True)
+
+
+def is_recent_writer(request: Request) -> bool:
+    """Whether the caller wrote within the read-your-writes window."""
+    key = _sticky_key(request)
+    return key is not None and recent_writers.get(key, False)
+
+
+def get_read_db(request: Request):
+    """Session for read-only endpoints, routed to the read replica unless the
+    caller wrote within the read-your-writes window."""
+    db = SessionLocal() if is_recent_writer(request) else ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,112 @@
+import asyncio
+import json
+from typing import Dict, Optional
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.metrics import metrics
+from app.websocket_manager import ConnectionManager, manager, post_topic
+
+
+class EventBus:
+    """Turns committed domain changes into WebSocket pushes.
+
+    Events are published on the app's event loop, so request threads hand
+    them over with ``call_soon_threadsafe``. Like counts change too often to
+    push one by one; the latest count per post is kept and flushed every
+    ``like_event_interval_seconds``.
+    """
+
+    def __init__(self, connections: ConnectionManager, like_interval: float = None):
+        self.connections = connections
+        self.like_interval = like_interval or settings.like_event_interval_seconds
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._pending_likes: Dict[int, int] = {}
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._flusher = asyncio.create_task(self._flush_likes_forever())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        self.flush_likes()
+        self._loop = None
+
+    def publish(self, topic: str, name: str, data: dict):
+        """Push an event to ``topic``'s subscribers; safe from any thread."""
+        self._call_soon(self._publish_now, topic, name, data)
+
+    def relay(self, topic: str, message: str):
+        """Send ``message`` to the other workers only; safe from any thread."""
+        self._call_soon(self.connections.backplane.publish, topic, message)
+
+    def likes_changed(self, post_id: int, likes_count: int):
+        self._call_soon(self._pending_likes.__setitem__, post_id, likes_count)
+
+    def flush_likes(self):
+        pending, self._pending_likes = self._pending_likes, {}
+        for post_id, likes_count in pending.items():
+            self._publish_now(
+                post_topic(post_id),
+                "likes_updated",
+                {"post_id": post_id, "likes_count": likes_count},
+            )
+
+    def _call_soon(self, callback, *args) -> bool:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            metrics.incr("events.dropped")
+            return False
+        loop.call_soon_threadsafe(callback, *args)
+        return True
+
+    def _publish_now(self, topic: str, name: str, data: dict):
+        message = json.dumps(
+            {
+                "type": "event",
+                "topic": topic,
+                "event": name,
+                "data": jsonable_encoder(data),
+            }
+        )
+        self.connections.publish(topic, message)
+        metrics.incr(f"events.{name}")
+
+    async def _flush_likes_forever(self):
+        while True:
+            await asyncio.sleep(self.like_interval)
+            self.flush_likes()
+
+
+event_bus = EventBus(manager)
+
+
+def on_commit(db: Session, callback, *args):
+    """Call ``callback(*args)`` once ``db`` commits; dropped on rollback."""
+    db.info.setdefault("pending_events", []).append((callback, args))
+
+
+def emit(db: Session, topic: str, name: str, data: dict):
+    """Queue an event that is published only once ``db`` commits."""
+    on_commit(db, event_bus.publish, topic, name, data)
+
+
+def emit_likes_changed(db: Session, post_id: int, likes_count: int):
+    on_commit(db, event_bus.likes_changed, post_id, likes_count)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending_events(session: Session):
+    for handler, args in session.info.pop("pending_events", ()):
+        handler(*args)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_pending_events(session: Session, transaction):
+    # Commits have already published; anything left was rolled back
+    if transaction.parent is None:
+        session.info.pop("pending_events", None)
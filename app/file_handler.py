@@ -1,22 +1,249 @@
+import asyncio
+import hashlib
+import json
 import os
+import tempfile
 import aiofiles
-from fastapi import UploadFile
+from fastapi import HTTPException, UploadFile, status
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models, schemas
 from app.config import settings
-from datetime import datetime
+from app.database import upsert_insert
+from app.events import on_commit
+from app.media import media_url
+from app.image_variants import STATUS_PENDING, delete_variants, wants_variants
+from typing import Optional, Tuple
 
+CHUNK_SIZE = 1024 * 1024
+# Bytes needed to recognise every supported format
+SNIFF_SIZE = 16
+# Room for multipart boundaries and part headers around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+# Major brands of plain MP4 files; HEIC, AVIF and QuickTime share the ftyp box
+MP4_BRANDS = {
+    b"isom",
+    b"iso2",
+    b"iso4",
+    b"iso5",
+    b"iso6",
+    b"mp41",
+    b"mp42",
+    b"avc1",
+    b"dash",
+    b"M4V ",
+}
 
-async def save_upload_file(upload_file: UploadFile, user_id: int) -> str:
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{timestamp}_{upload_file.filename}"
-    file_path = os.path.join(settings.upload_dir, str(user_id), filename)
 
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File too large. Maximum size is {settings.max_upload_size} bytes",
+    )
 
-    async with aiofiles.open(file_path, "wb") as out_file:
-        content = await upload_file.read()
-        await out_file.write(content)
 
-    return file_path
+def _invalid_content() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="File content does not match a supported type",
+    )
+
+
+def detect_file_type(header: bytes) -> Optional[str]:
+    """Return the extension matching the file's magic bytes, if supported."""
+    if header.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return ".gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return ".webp"
+    if header[4:8] == b"ftyp" and header[8:12] in MP4_BRANDS:
+        return ".mp4"
+    if header.startswith(b"\x1a\x45\xdf\xa3"):
+        return ".webm"
+    return None
+
+
+def blob_path(sha256: str, extension: str) -> str:
+    """Where the blob for ``sha256`` lives, sharded by its first two bytes."""
+    return os.path.join(
+        settings.upload_dir, "blobs", sha256[:2], sha256[2:4], sha256 + extension
+    )
+
+
+def _to_schema(media_file: models.MediaFile, blob: models.MediaBlob):
+    return schemas.MediaFile(
+        id=media_file.id,
+        filename=media_file.filename,
+        sha256=blob.sha256,
+        size=blob.size,
+        location=blob_path(blob.sha256, blob.extension),
+        url=media_url(blob_path(blob.sha256, blob.extension)),
+        variants_status=blob.variants_status,
+    )
+
+
+async def _store_blob(
+    db: AsyncSession,
+    temp_path: str,
+    sha256: str,
+    extension: str,
+    size: int,
+    user_id: int,
+    filename: str,
+) -> schemas.MediaFile:
+    # The upsert takes the write lock, so placing the file and inserting
+    # the reference can't interleave with a delete of the same blob
+    await db.execute(
+        upsert_insert(db, models.MediaBlob)
+        .values(
+            sha256=sha256,
+            extension=extension,
+            size=size,
+            ref_count=1,
+            variants_status=STATUS_PENDING if wants_variants(extension) else None,
+        )
+        .on_conflict_do_update(
+            index_elements=["sha256"],
+            set_={"ref_count": models.MediaBlob.ref_count + 1},
+        )
+    )
+    blob = await db.get(models.MediaBlob, sha256, populate_existing=True)
+    final_path = blob_path(sha256, blob.extension)
+    placed = not os.path.exists(final_path)
+    if placed:
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(temp_path, final_path)
+    else:
+        os.remove(temp_path)
+
+    media_file = models.MediaFile(
+        user_id=user_id, sha256=sha256, filename=os.path.basename(filename)
+    )
+    db.add(media_file)
+    try:
+        await db.commit()
+    except BaseException:
+        # Without the row nothing would ever delete the file we just placed
+        if placed:
+            _remove(final_path)
+        raise
+    return _to_schema(media_file, blob)
+
+
+async def _discard(db: AsyncSession, temp_path: str):
+    await db.rollback()
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+
+async def save_upload_file(
+    upload_file: UploadFile, user_id: int, db: AsyncSession
+) -> schemas.MediaFile:
+    """Stream ``upload_file`` to disk, hashing it on the way, and record it.
+
+    Content is stored once under its SHA-256 in ``blobs/``; each upload gets
+    its own ``MediaFile`` row pointing at the shared blob, whose reference
+    count tracks how many rows use it. Data goes to a temporary file and is
+    moved into place only after the size and content checks pass, so readers
+    never see a partial file and memory use stays flat.
+    """
+    temp_dir = os.path.join(settings.upload_dir, "tmp")
+    os.makedirs(temp_dir, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir, suffix=".part")
+    os.close(fd)
+    try:
+        size = 0
+        header = b""
+        digest = hashlib.sha256()
+        async with aiofiles.open(temp_path, "wb") as out_file:
+            while chunk := await upload_file.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > settings.max_upload_size:
+                    raise _too_large()
+                if len(header) < SNIFF_SIZE:
+                    header += chunk[: SNIFF_SIZE - len(header)]
+                    if len(header) >= SNIFF_SIZE and not detect_file_type(header):
+                        raise _invalid_content()
+                digest.update(chunk)
+                await out_file.write(chunk)
+        extension = detect_file_type(header)
+        if not extension:
+            raise _invalid_content()
+        return await _store_blob(
+            db,
+            temp_path,
+            digest.hexdigest(),
+            extension,
+            size,
+            user_id,
+            upload_file.filename,
+        )
+    except BaseException:
+        await _discard(db, temp_path)
+        raise
+
+
+def _inspect_file(path: str) -> Tuple[str, bytes, int]:
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as in_file:
+        header = in_file.read(SNIFF_SIZE)
+        in_file.seek(0)
+        while chunk := in_file.read(CHUNK_SIZE):
+            size += len(chunk)
+            digest.update(chunk)
+    return digest.hexdigest(), header, size
+
+
+async def save_local_file(
+    path: str, filename: str, user_id: int, db: AsyncSession
+) -> schemas.MediaFile:
+    """Store a file that is already on disk, with the same checks as
+    ``save_upload_file``. The file is moved into place or removed."""
+    try:
+        sha256, header, size = await asyncio.to_thread(_inspect_file, path)
+        if size > settings.max_upload_size:
+            raise _too_large()
+        extension = detect_file_type(header)
+        if not extension:
+            raise _invalid_content()
+        return await _store_blob(db, path, sha256, extension, size, user_id, filename)
+    except BaseException:
+        await _discard(db, path)
+        raise
+
+
+async def delete_media_file(db: AsyncSession, media_file: models.MediaFile):
+    """Drop one reference to a blob, removing the blob once nothing uses it."""
+    sha256 = media_file.sha256
+    await db.delete(media_file)
+    # The row references the blob, so it has to go before the blob can
+    await db.flush()
+    result = await db.execute(
+        update(models.MediaBlob)
+        .where(models.MediaBlob.sha256 == sha256)
+        .values(ref_count=models.MediaBlob.ref_count - 1)
+        .returning(models.MediaBlob.ref_count, models.MediaBlob.extension)
+    )
+    row = result.first()
+    if row is not None and row.ref_count <= 0:
+        await delete_variants(db, sha256)
+        await db.execute(
+            delete(models.MediaBlob).where(models.MediaBlob.sha256 == sha256)
+        )
+        on_commit(db.sync_session, _remove, blob_path(sha256, row.extension))
+    await db.commit()
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
 
 
 def get_file_extension(filename: str) -> str:
@@ -26,3 +253,101 @@ def get_file_extension(filename: str) -> str:
 def is_valid_file_type(filename: str) -> bool:
     allowed_extensions = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".mp4", ".webm"}
     return get_file_extension(filename) in allowed_extensions
+
+
+class UploadSizeLimitMiddleware:
+    """Abort upload requests with 413 as soon as the body passes ``max_body_size``.
+
+    Requests that declare a larger Content-Length are refused before any of the
+    body is read. Chunked bodies are counted as they arrive; once over the
+    limit the app sees a disconnect and its response is replaced by the 413.
+    Without an explicit ``max_body_size`` the current upload limit applies.
+    """
+
+    def __init__(
+        self,
+        app,
+        max_body_size: Optional[int] = None,
+        path_prefix: str = "/api/upload",
+    ):
+        self.app = app
+        self._max_body_size = max_body_size
+        self.path_prefix = path_prefix
+
+    @property
+    def max_body_size(self) -> int:
+        if self._max_body_size is not None:
+            return self._max_body_size
+        return settings.max_upload_size + MULTIPART_OVERHEAD
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length:
+            try:
+                declared = int(content_length)
+            except ValueError:
+                declared = -1
+            if declared < 0:
+                await self._reject(
+                    send, status.HTTP_400_BAD_REQUEST, "Invalid Content-Length"
+                )
+                return
+            if declared > self.max_body_size:
+                await self._reject(send)
+                return
+
+        received = 0
+        too_large = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            if too_large:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    too_large = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        response_started = False
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if too_large:
+                if not response_started:
+                    response_started = True
+                    await self._reject(send)
+                return
+            response_started = True
+            await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+        if too_large and not response_started:
+            await self._reject(send)
+
+    async def _reject(
+        self,
+        send,
+        status_code: int = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail: Optional[str] = None,
+    ):
+        body = json.dumps({"detail": detail or _too_large().detail}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status_code,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"connection", b"close"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,215 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Set, Tuple
+from PIL import ExifTags, Image, ImageOps
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models
+from app.config import settings
+from app.database import AsyncSessionLocal, upsert_insert
+from app.events import on_commit
+from app.metrics import metrics
+
+IMAGE_EXTENSIONS = {".jpg", ".png", ".gif", ".webp"}
+
+STATUS_PENDING = "pending"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+
+def variant_path(sha256: str, width: int) -> str:
+    """Variants sit next to their blob: ``<hash>_<width>.webp``."""
+    return os.path.join(
+        settings.upload_dir, "blobs", sha256[:2], sha256[2:4], f"{sha256}_{width}.webp"
+    )
+
+
+def render_variants(
+    source_path: str, widths: List[int], quality: int
+) -> List[Tuple[int, int, int]]:
+    """Write a WebP copy of the image at each width; returns (width, height, size).
+
+    Runs in a worker process. Images are never upscaled: widths at or above
+    the original are skipped, and an image narrower than every width gets a
+    single variant at its own size.
+    """
+    results = []
+    with Image.open(source_path) as image:
+        width, height = image.size
+        if image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+            width, height = height, width
+        targets = sorted(w for w in widths if w < width) or [width]
+        # Lets the JPEG decoder downscale by a power of two while decoding,
+        # keeping both sides at least as large as the widest variant
+        image.draft("RGB", (targets[-1], targets[-1]))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        for width in targets:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            path = f"{os.path.splitext(source_path)[0]}_{width}.webp"
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+            try:
+                with os.fdopen(fd, "wb") as out_file:
+                    resized.save(out_file, "WEBP", quality=quality, method=4)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+            results.append((width, height, os.path.getsize(path)))
+    return results
+
+
+class VariantPool:
+    """Process pool for image resizing, started on first use.
+
+    Workers are spawned rather than forked so they don't inherit the server's
+    threads and open database connections.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), fn, *args)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+variant_pool = VariantPool(settings.image_variant_workers)
+
+
+def wants_variants(extension: str) -> bool:
+    return extension in IMAGE_EXTENSIONS
+
+
+def needs_variants(
+    status: Optional[str],
+    attempts: int = 0,
+    attempted_at: Optional[datetime] = None,
+) -> bool:
+    """Pending blobs (possibly orphaned by a restart) are rendered again, and
+    failed ones once their backoff has passed, until they run out of
+    attempts. None means the file is not an image."""
+    if status == STATUS_FAILED:
+        if attempts >= settings.image_variant_max_attempts:
+            return False
+        if attempted_at is None:
+            return True
+        delay = settings.image_variant_retry_seconds * 2 ** max(attempts - 1, 0)
+        return datetime.utcnow() >= attempted_at + timedelta(seconds=delay)
+    return status is not None and status != STATUS_READY
+
+
+# Blobs being rendered in this process, so repeated requests don't pile up
+_rendering: Set[str] = set()
+
+
+async def generate_variants(sha256: str, source_path: str):
+    """Render and record the variants for one blob.
+
+    Meant to run as a background task after the response has gone out, so it
+    opens its own session rather than borrowing the request's.
+    """
+    if sha256 in _rendering:
+        return
+    _rendering.add(sha256)
+    try:
+        async with AsyncSessionLocal() as db:
+            await _generate_variants(db, sha256, source_path)
+    finally:
+        _rendering.discard(sha256)
+
+
+async def _generate_variants(db: AsyncSession, sha256: str, source_path: str):
+    try:
+        rendered = await variant_pool.run(
+            render_variants,
+            source_path,
+            settings.image_variant_widths,
+            settings.image_variant_quality,
+        )
+    except Exception:
+        metrics.incr("image_variants.failed")
+        await db.execute(
+            update(models.MediaBlob)
+            .where(models.MediaBlob.sha256 == sha256)
+            .values(
+                variants_status=STATUS_FAILED,
+                variants_attempts=models.MediaBlob.variants_attempts + 1,
+                variants_attempted_at=datetime.utcnow(),
+            )
+        )
+        await db.commit()
+        return
+
+    result = await db.execute(
+        update(models.MediaBlob)
+        .where(models.MediaBlob.sha256 == sha256)
+        .values(variants_status=STATUS_READY)
+    )
+    if result.rowcount == 0:
+        # The blob was deleted while we were rendering
+        await db.rollback()
+        for width, _, _ in rendered:
+            _remove(variant_path(sha256, width))
+        return
+    await db.execute(
+        upsert_insert(db, models.MediaVariant)
+        .values(
+            [
+                {"sha256": sha256, "width": width, "height": height, "size": size}
+                for width, height, size in rendered
+            ]
+        )
+        .on_conflict_do_nothing()
+    )
+    await db.commit()
+    metrics.incr("image_variants.generated", len(rendered))
+
+
+async def delete_variants(db: AsyncSession, sha256: str):
+    """Remove a blob's variant rows, and their files once the caller commits."""
+    result = await db.execute(
+        delete(models.MediaVariant)
+        .where(models.MediaVariant.sha256 == sha256)
+        .returning(models.MediaVariant.width)
+    )
+    for width in result.scalars().all():
+        on_commit(db.sync_session, _remove, variant_path(sha256, width))
+
+
+def pick_variant(variants: list, width: int):
+    """The smallest variant at least ``width`` wide, else the largest one."""
+    ordered = sorted(variants, key=lambda variant: variant.width)
+    for variant in ordered:
+        if variant.width >= width:
+            return variant
+    return ordered[-1] if ordered else None
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -1,22 +1,41 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import (
+    BackgroundTasks,
     FastAPI,
     Depends,
     HTTPException,
     status,
     Request,
+    Response,
     UploadFile,
     File,
+    Header,
+    Query,
     WebSocket,
+    WebSocketDisconnect,
 )
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
-from datetime import timedelta
+import json
 import app.models as models
-from app.database import SessionLocal, engine, get_db
+from app.database import (
+    ReadSessionLocal,
+    SessionLocal,
+    bump_counter,
+    engine,
+    get_async_db,
+    get_db,
+    get_read_db,
+    mark_recent_write,
+    upsert_insert,
+)
 from app.schemas import (
     User,
     UserCreate,
@@ -24,24 +43,94 @@ from app.schemas import (
     PostCreate,
     Comment,
     CommentCreate,
+    MediaFile,
+    MediaVariants,
+    RefreshRequest,
+    ResumableUpload,
+    ResumableUploadCreate,
     Token,
+    TokenClaims,
 )
 from app.auth import (
+    REFRESH_TOKEN_TYPE,
+    create_user_tokens,
+    decode_token,
     get_current_user,
     get_password_hash,
-    verify_password,
-    create_access_token,
-    ACCESS_TOKEN_EXPIRE_MINUTES,
+    get_token_claims,
+    password_pool,
+    token_user_id,
+    verify_password_async,
 )
 from app.config import settings
-from app.file_handler import save_upload_file, is_valid_file_type
-from app.websocket_manager import manager
+from app.file_handler import (
+    UploadSizeLimitMiddleware,
+    blob_path,
+    delete_media_file,
+    save_upload_file,
+    is_valid_file_type,
+)
+from app.image_variants import (
+    generate_variants,
+    needs_variants,
+    pick_variant,
+    variant_pool,
+    variant_path,
+)
+from app.media import MediaFileResponse, MediaGZipMiddleware, media_path, media_url
+from app.resumable_uploads import (
+    UPLOAD_LENGTH_HEADER,
+    UPLOAD_OFFSET_HEADER,
+    append_chunk,
+    cancel_upload,
+    collect_expired_uploads_forever,
+    complete_upload,
+    create_upload,
+    get_upload,
+)
+from app.events import emit, emit_likes_changed, event_bus
+from app.response_cache import (
+    POSTS_TAG,
+    cached_json,
+    comments_tag,
+    invalidate,
+    post_tag,
+)
+from app.timeline import fan_out, follow, remove_post, timeline_page, unfollow
+from app.websocket_manager import (
+    FEED_TOPIC,
+    FORMAT_JSON,
+    FORMAT_MSGPACK,
+    manager,
+    post_topic,
+    user_topic,
+)
+from app.metrics import metrics
+from app.pagination import (
+    NEXT_CURSOR_HEADER,
+    decode_id_cursor,
+    encode_id_cursor,
+    keyset_page,
+)
 from fastapi.exceptions import RequestValidationError
 import uvicorn
 
 models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title=settings.app_name)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    upload_gc = asyncio.create_task(collect_expired_uploads_forever())
+    await manager.start()
+    await event_bus.start()
+    yield
+    await event_bus.stop()
+    await manager.stop()
+    upload_gc.cancel()
+    variant_pool.shutdown()
+
+
+app = FastAPI(title=settings.app_name, lifespan=lifespan)
 
 # Add CORS middleware - keeping it permissive for development
 app.add_middleware(
@@ -50,10 +139,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, UPLOAD_OFFSET_HEADER, UPLOAD_LENGTH_HEADER],
 )
 
 # Add Gzip compression
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+app.add_middleware(MediaGZipMiddleware, minimum_size=1000)
+
+# Refuse oversized uploads before the multipart body is spooled
+app.add_middleware(UploadSizeLimitMiddleware)
+
+
+@app.middleware("http")
+async def track_recent_writes(request: Request, call_next):
+    request.state.user_id = token_user_id(request.headers.get("authorization"))
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        mark_recent_write(request)
+    return response
 
 
 @app.middleware("http")
@@ -63,26 +165,130 @@ async def add_platform_headers(request: Request, call_next):
     return response
 
 
+_post_adapter = TypeAdapter(Post)
+_posts_adapter = TypeAdapter(List[Post])
+_comments_adapter = TypeAdapter(List[Comment])
+
+
+def _post_query(db: Session):
+    return db.query(models.Post).options(selectinload(models.Post.author))
+
+
+def _post_event(post: models.Post) -> dict:
+    return {
+        "id": post.id,
+        "author_id": post.author_id,
+        "content": post.content,
+        "image_url": post.image_url,
+        "created_at": post.created_at,
+    }
+
+
+def _comment_event(comment: models.Comment) -> dict:
+    return {
+        "id": comment.id,
+        "post_id": comment.post_id,
+        "author_id": comment.author_id,
+        "content": comment.content,
+        "created_at": comment.created_at,
+    }
+
+
+def _cursor_headers(next_cursor: Optional[str]) -> dict:
+    return {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+
+
+def _get_post_or_404(db: Session, post_id: int):
+    post = db.query(models.Post.id).filter(models.Post.id == post_id).first()
+    if post is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+    return post
+
+
+def _add_like(db: Session, post_id: int, user_id: int) -> bool:
+    """Insert a like row, doing nothing if it is already there."""
+    result = db.execute(
+        upsert_insert(db, models.likes)
+        .values(user_id=user_id, post_id=post_id)
+        .on_conflict_do_nothing()
+    )
+    if result.rowcount == 1:
+        likes_count = bump_counter(db, models.Post, post_id, models.Post.likes_count, 1)
+        emit_likes_changed(db, post_id, likes_count)
+        invalidate(db, post_tag(post_id))
+        return True
+    return False
+
+
+def _remove_like(db: Session, post_id: int, user_id: int) -> bool:
+    result = db.execute(
+        models.likes.delete().where(
+            models.likes.c.user_id == user_id, models.likes.c.post_id == post_id
+        )
+    )
+    if result.rowcount == 1:
+        likes_count = bump_counter(
+            db, models.Post, post_id, models.Post.likes_count, -1
+        )
+        emit_likes_changed(db, post_id, likes_count)
+        invalidate(db, post_tag(post_id))
+        return True
+    return False
+
+
+def _like_state(db: Session, post_id: int, liked: bool):
+    likes_count = (
+        db.query(models.Post.likes_count).filter(models.Post.id == post_id).scalar()
+    )
+    return {"post_id": post_id, "liked": liked, "likes_count": likes_count}
+
+
 @app.post("/token", response_model=Token)
 async def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    user = (
-        db.query(models.User)
-        .filter(models.User.user_name == form_data.username)
-        .first()
+    result = await db.execute(
+        select(models.User).where(models.User.user_name == form_data.username)
     )
-    if not user or not verify_password(form_data.password, user.password_hash):
+    user = result.scalars().first()
+    if not user or not await verify_password_async(
+        form_data.password, user.password_hash
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.user_name}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return create_user_tokens(user)
+
+
+@app.post("/token/refresh", response_model=Token)
+async def refresh_access_token(
+    body: RefreshRequest, db: AsyncSession = Depends(get_async_db)
+):
+    payload = decode_token(body.refresh_token, REFRESH_TOKEN_TYPE)
+    user = await db.get(models.User, payload.get("uid"))
+    if user is None or user.token_version != payload.get("ver"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return create_user_tokens(user)
+
+
+@app.post("/token/revoke")
+def revoke_tokens(
+    db: Session = Depends(get_db),
+    current_user: TokenClaims = Depends(get_token_claims),
+):
+    user = db.query(models.User).filter(models.User.id == current_user.id).first()
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    user.token_version += 1
+    db.commit()
+    return {"message": "Tokens revoked successfully"}
 
 
 @app.post("/users/", response_model=User)
@@ -95,7 +301,7 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
     )
     if db_user:
         raise HTTPException(status_code=400, detail="Username already taken")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = password_pool.submit(get_password_hash, user.password).result()
     db_user = models.User(
         user_name=user.user_name, email=user.email, password_hash=hashed_password
     )
@@ -110,14 +316,57 @@ def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
 
+def _follow_state(db: Session, user_id: int, following: bool):
+    followers_count = (
+        db.query(models.User.followers_count).filter(models.User.id == user_id).scalar()
+    )
+    if followers_count is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {
+        "user_id": user_id,
+        "following": following,
+        "followers_count": followers_count,
+    }
+
+
+@app.put("/users/{user_id}/follow")
+def follow_user(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: TokenClaims = Depends(get_token_claims),
+):
+    if user_id == current_user.id:
+        raise HTTPException(status_code=400, detail="You cannot follow yourself")
+    _follow_state(db, user_id, True)
+    follow(db, current_user.id, user_id)
+    db.commit()
+    return _follow_state(db, user_id, True)
+
+
+@app.delete("/users/{user_id}/follow")
+def unfollow_user(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: TokenClaims = Depends(get_token_claims),
+):
+    _follow_state(db, user_id, False)
+    unfollow(db, current_user.id, user_id)
+    db.commit()
+    return _follow_state(db, user_id, False)
+
+
 @app.post("/posts/", response_model=Post)
 def create_post(
     post: PostCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: TokenClaims = Depends(get_token_claims),
 ):
     db_post = models.Post(**post.dict(), author_id=current_user.id)
     db.add(db_post)
+    db.flush()
+    fan_out(db, db_post)
+    emit(db, FEED_TOPIC, "post_created", _post_event(db_post))
+    invalidate(db, POSTS_TAG)
     db.commit()
     db.refresh(db_post)
     return db_post
@@ -125,42 +374,95 @@ def create_post(
 
 @app.get("/posts/", response_model=List[Post])
 def read_posts(
+    request: Request,
     skip: int = 0,
-    limit: int = 10,
-    db: Session = Depends(get_db),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
-    posts = db.query(models.Post).offset(skip).limit(limit).all()
+    def build():
+        posts, next_cursor = keyset_page(
+            _post_query(db),
+            models.Post.created_at,
+            models.Post.id,
+            cursor,
+            limit,
+            skip,
+        )
+        tags = [POSTS_TAG, *(post_tag(post.id) for post in posts)]
+        return posts, _cursor_headers(next_cursor), tags
+
+    return cached_json(request, ("posts", skip, limit, cursor), _posts_adapter, build)
+
+
+@app.get("/timeline", response_model=List[Post])
+def read_timeline(
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    current_user: TokenClaims = Depends(get_token_claims),
+):
+    """Posts by the current user and everyone they follow, newest first."""
+    posts, next_cursor = timeline_page(db, current_user.id, cursor, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return posts
 
 
 @app.get("/posts/{post_id}", response_model=Post)
 def read_post(
+    request: Request,
     post_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if post is None:
-        raise HTTPException(status_code=404, detail="Post not found")
-    return post
+    def build():
+        post = _post_query(db).filter(models.Post.id == post_id).first()
+        if post is None:
+            raise HTTPException(status_code=404, detail="Post not found")
+        return post, {}, [post_tag(post_id)]
+
+    return cached_json(request, ("post", post_id), _post_adapter, build)
 
 
 @app.post("/posts/{post_id}/like")
 def like_post(
     post_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: TokenClaims = Depends(get_token_claims),
 ):
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if post is None:
-        raise HTTPException(status_code=404, detail="Post not found")
-    if current_user in post.liked_by:
-        post.liked_by.remove(current_user)
-    else:
-        post.liked_by.append(current_user)
+    _get_post_or_404(db, post_id)
+    liked = not _remove_like(db, post_id, current_user.id)
+    if liked:
+        _add_like(db, post_id, current_user.id)
     db.commit()
-    return {"message": "Like toggled successfully"}
+    return {"message": "Like toggled successfully", "liked": liked}
+
+
+@app.put("/posts/{post_id}/like")
+def add_like(
+    post_id: int,
+    db: Session = Depends(get_db),
+    current_user: TokenClaims = Depends(get_token_claims),
+):
+    _get_post_or_404(db, post_id)
+    _add_like(db, post_id, current_user.id)
+    db.commit()
+    return _like_state(db, post_id, True)
+
+
+@app.delete("/posts/{post_id}/like")
+def remove_like(
+    post_id: int,
+    db: Session = Depends(get_db),
+    current_user: TokenClaims = Depends(get_token_claims),
+):
+    _get_post_or_404(db, post_id)
+    _remove_like(db, post_id, current_user.id)
+    db.commit()
+    return _like_state(db, post_id, False)
 
 
 @app.post("/posts/{post_id}/comments/", response_model=Comment)
@@ -168,7 +470,7 @@ def create_comment(
     post_id: int,
     comment: CommentCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: TokenClaims = Depends(get_token_claims),
 ):
     post = db.query(models.Post).filter(models.Post.id == post_id).first()
     if post is None:
@@ -177,6 +479,15 @@ def create_comment(
         **comment.dict(), author_id=current_user.id, post_id=post_id
     )
     db.add(db_comment)
+    comments_count = bump_counter(
+        db, models.Post, post_id, models.Post.comments_count, 1
+    )
+    db.flush()
+    data = {**_comment_event(db_comment), "comments_count": comments_count}
+    emit(db, post_topic(post_id), "comment_created", data)
+    if post.author_id != current_user.id:
+        emit(db, user_topic(post.author_id), "comment_on_your_post", data)
+    invalidate(db, post_tag(post_id), comments_tag(post_id))
     db.commit()
     db.refresh(db_comment)
     return db_comment
@@ -184,35 +495,93 @@ def create_comment(
 
 @app.get("/posts/{post_id}/comments/", response_model=List[Comment])
 def read_comments(
+    request: Request,
     post_id: int,
     skip: int = 0,
-    limit: int = 10,
-    db: Session = Depends(get_db),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if post is None:
-        raise HTTPException(status_code=404, detail="Post not found")
-    comments = (
-        db.query(models.Comment)
-        .filter(models.Comment.post_id == post_id)
-        .offset(skip)
+    def build():
+        _get_post_or_404(db, post_id)
+        comments, next_cursor = keyset_page(
+            db.query(models.Comment)
+            .options(selectinload(models.Comment.author))
+            .filter(models.Comment.post_id == post_id),
+            models.Comment.created_at,
+            models.Comment.id,
+            cursor,
+            limit,
+            skip,
+        )
+        return comments, _cursor_headers(next_cursor), [comments_tag(post_id)]
+
+    key = ("comments", post_id, skip, limit, cursor)
+    return cached_json(request, key, _comments_adapter, build)
+
+
+def _liker_ids(db: Session, post_id: int, after: int, limit: int) -> List[int]:
+    return [
+        user_id
+        for (user_id,) in db.query(models.likes.c.user_id)
+        .filter(models.likes.c.post_id == post_id, models.likes.c.user_id > after)
+        .order_by(models.likes.c.user_id)
         .limit(limit)
-        .all()
-    )
-    return comments
+    ]
 
 
 @app.get("/posts/{post_id}/likes")
 def get_likes(
+    response: Response,
     post_id: int,
-    db: Session = Depends(get_db),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    count_only: bool = False,
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if post is None:
-        raise HTTPException(status_code=404, detail="Post not found")
-    return [{"post_id": post_id, "user_id": user.id} for user in post.liked_by]
+    if count_only:
+        likes_count = (
+            db.query(models.Post.likes_count).filter(models.Post.id == post_id).scalar()
+        )
+        if likes_count is None:
+            raise HTTPException(status_code=404, detail="Post not found")
+        return {"post_id": post_id, "likes_count": likes_count}
+
+    _get_post_or_404(db, post_id)
+    after = decode_id_cursor(cursor) if cursor is not None else 0
+    user_ids = _liker_ids(db, post_id, after, limit + 1)
+    if len(user_ids) > limit:
+        user_ids = user_ids[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_id_cursor(user_ids[-1])
+    return [{"post_id": post_id, "user_id": user_id} for user_id in user_ids]
+
+
+@app.get("/posts/{post_id}/likes/export")
+def export_likes(
+    post_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+):
+    _get_post_or_404(db, post_id)
+
+    def rows():
+        # The request's session is closed before streaming starts
+        stream_db = ReadSessionLocal()
+        try:
+            after = 0
+            while True:
+                user_ids = _liker_ids(stream_db, post_id, after, 1000)
+                if not user_ids:
+                    return
+                for user_id in user_ids:
+                    yield json.dumps({"post_id": post_id, "user_id": user_id}) + "\n"
+                after = user_ids[-1]
+        finally:
+            stream_db.close()
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
 
 
 @app.put("/comments/{comment_id}", response_model=Comment)
@@ -235,6 +604,7 @@ def update_comment(
     for key, value in comment.dict().items():
         setattr(db_comment, key, value)
 
+    invalidate(db, comments_tag(db_comment.post_id))
     db.commit()
     db.refresh(db_comment)
     return db_comment
@@ -257,6 +627,17 @@ def delete_comment(
         )
 
     db.delete(db_comment)
+    post_id = db_comment.post_id
+    comments_count = bump_counter(
+        db, models.Post, post_id, models.Post.comments_count, -1
+    )
+    emit(
+        db,
+        post_topic(post_id),
+        "comment_deleted",
+        {"id": comment_id, "post_id": post_id, "comments_count": comments_count},
+    )
+    invalidate(db, post_tag(post_id), comments_tag(post_id))
     db.commit()
     return {"message": "Comment deleted successfully"}
 
@@ -279,6 +660,7 @@ def update_post(
     for key, value in post.dict().items():
         setattr(db_post, key, value)
 
+    invalidate(db, post_tag(post_id))
     db.commit()
     db.refresh(db_post)
     return db_post
@@ -298,11 +680,22 @@ def delete_post(
             status_code=403, detail="Not authorized to delete this post"
         )
 
+    remove_post(db, post_id)
     db.delete(db_post)
+    emit(db, FEED_TOPIC, "post_deleted", {"id": post_id})
+    emit(db, post_topic(post_id), "post_deleted", {"id": post_id})
+    invalidate(db, POSTS_TAG, post_tag(post_id), comments_tag(post_id))
     db.commit()
     return {"message": "Post deleted successfully"}
 
 
+@app.get("/api/metrics")
+def get_metrics(current_user: TokenClaims = Depends(get_token_claims)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admins only")
+    return metrics.snapshot()
+
+
 # New endpoints for platform capabilities and file upload
 @app.get("/api/platform/capabilities")
 async def get_platform_capabilities():
@@ -319,38 +712,239 @@ async def get_platform_capabilities():
     }
 
 
-@app.post("/api/upload")
+def _invalid_file_type():
+    return HTTPException(
+        status_code=400,
+        detail="Invalid file type. Supported types: jpg, png, gif, webp, mp4, webm",
+    )
+
+
+def _schedule_variants(
+    background_tasks: BackgroundTasks, sha256: str, status: Optional[str], path: str
+):
+    if needs_variants(status):
+        # Resizing happens after the response is sent, in the variant pool
+        background_tasks.add_task(generate_variants, sha256, path)
+
+
+@app.post("/api/upload", response_model=MediaFile)
 async def upload_file(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     platform: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user),
 ):
     if not is_valid_file_type(file.filename):
+        raise _invalid_file_type()
+
+    stored = await save_upload_file(file, current_user.id, db)
+    _schedule_variants(
+        background_tasks, stored.sha256, stored.variants_status, stored.location
+    )
+    return stored
+
+
+@app.post("/api/upload/resumable", response_model=ResumableUpload, status_code=201)
+def create_resumable_upload(
+    upload: ResumableUploadCreate,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+):
+    """Start a resumable upload; send the bytes with PATCH, then complete it."""
+    if not is_valid_file_type(upload.filename):
+        raise _invalid_file_type()
+    session = create_upload(current_user.id, upload.filename, upload.size)
+    response.headers["Location"] = f"/api/upload/resumable/{session.id}"
+    return session
+
+
+@app.api_route(
+    "/api/upload/resumable/{upload_id}",
+    methods=["GET", "HEAD"],
+    response_model=ResumableUpload,
+)
+def read_resumable_upload(
+    upload_id: str,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+):
+    session = get_upload(upload_id, current_user.id)
+    response.headers[UPLOAD_OFFSET_HEADER] = str(session.offset)
+    response.headers[UPLOAD_LENGTH_HEADER] = str(session.size)
+    response.headers["Cache-Control"] = "no-store"
+    return session
+
+
+@app.patch("/api/upload/resumable/{upload_id}", status_code=204)
+async def append_resumable_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias=UPLOAD_OFFSET_HEADER),
+    current_user: User = Depends(get_current_user),
+):
+    offset = await append_chunk(
+        upload_id, current_user.id, upload_offset, request.stream()
+    )
+    return Response(status_code=204, headers={UPLOAD_OFFSET_HEADER: str(offset)})
+
+
+@app.post("/api/upload/resumable/{upload_id}/complete", response_model=MediaFile)
+async def complete_resumable_upload(
+    upload_id: str,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user),
+):
+    stored = await complete_upload(upload_id, current_user.id, db)
+    _schedule_variants(
+        background_tasks, stored.sha256, stored.variants_status, stored.location
+    )
+    return stored
+
+
+@app.delete("/api/upload/resumable/{upload_id}")
+def cancel_resumable_upload(
+    upload_id: str, current_user: User = Depends(get_current_user)
+):
+    cancel_upload(upload_id, current_user.id)
+    return {"message": "Upload cancelled"}
+
+
+@app.delete("/api/upload/{file_id}")
+async def delete_upload(
+    file_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user),
+):
+    media_file = await db.get(models.MediaFile, file_id)
+    if media_file is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    if media_file.user_id != current_user.id:
         raise HTTPException(
-            status_code=400,
-            detail="Invalid file type. Supported types: jpg, png, gif, webp, mp4, webm",
+            status_code=403, detail="Not authorized to delete this file"
+        )
+
+    await delete_media_file(db, media_file)
+    return {"message": "File deleted successfully"}
+
+
+def _get_media_file_or_404(db: Session, file_id: int):
+    media_file = (
+        db.query(models.MediaFile)
+        .options(
+            selectinload(models.MediaFile.blob).selectinload(models.MediaBlob.variants)
+        )
+        .filter(models.MediaFile.id == file_id)
+        .first()
+    )
+    if media_file is None or media_file.blob is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return media_file
+
+
+def _retry_variants(background_tasks: BackgroundTasks, blob: models.MediaBlob):
+    if needs_variants(
+        blob.variants_status, blob.variants_attempts, blob.variants_attempted_at
+    ):
+        background_tasks.add_task(
+            generate_variants, blob.sha256, blob_path(blob.sha256, blob.extension)
         )
 
-    file_path = await save_upload_file(file, current_user.id)
-    return {"filename": file.filename, "location": file_path}
+
+@app.get("/api/upload/{file_id}/variants", response_model=MediaVariants)
+def read_upload_variants(
+    background_tasks: BackgroundTasks,
+    file_id: int,
+    width: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+):
+    media_file = _get_media_file_or_404(db, file_id)
+    _retry_variants(background_tasks, media_file.blob)
+    variants = media_file.blob.variants
+    if width is not None:
+        best = pick_variant(variants, width)
+        variants = [best] if best else []
+    return {
+        "id": media_file.id,
+        "sha256": media_file.sha256,
+        "status": media_file.blob.variants_status,
+        "variants": [
+            {
+                "width": variant.width,
+                "height": variant.height,
+                "size": variant.size,
+                "location": variant_path(variant.sha256, variant.width),
+                "url": media_url(variant_path(variant.sha256, variant.width)),
+            }
+            for variant in variants
+        ],
+    }
+
+
+@app.get("/api/upload/{file_id}/image")
+def read_upload_image(
+    background_tasks: BackgroundTasks,
+    file_id: int,
+    width: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Redirect to the closest variant to ``width``, or to the original until
+    variants exist."""
+    media_file = _get_media_file_or_404(db, file_id)
+    blob = media_file.blob
+    _retry_variants(background_tasks, blob)
+    variant = pick_variant(blob.variants, width) if width is not None else None
+    if variant is not None:
+        path = variant_path(variant.sha256, variant.width)
+    else:
+        path = blob_path(blob.sha256, blob.extension)
+    return RedirectResponse(media_url(path))
+
+
+@app.api_route("/media/{path:path}", methods=["GET", "HEAD"])
+async def serve_media(path: str):
+    return MediaFileResponse(media_path(path))
 
 
 # WebSocket endpoint
 @app.websocket("/ws")
 async def websocket_endpoint(
-    websocket: WebSocket, token: str, db: Session = Depends(get_db)
+    websocket: WebSocket,
+    token: str,
+    db: AsyncSession = Depends(get_async_db),
+    message_format: str = Query(
+        FORMAT_JSON, alias="format", pattern=f"^({FORMAT_JSON}|{FORMAT_MSGPACK})$"
+    ),
 ):
+    """Push channel. Each socket starts subscribed to its user's topic and
+    manages further subscriptions with control messages. ``?format=msgpack``
+    switches to binary frames carrying batches of MessagePack messages."""
     try:
         user = await get_current_user(token, db)
-        await manager.connect(websocket, user.id)
-        try:
-            while True:
-                data = await websocket.receive_text()
-                await manager.broadcast(f"Message from {user.user_name}: {data}")
-        except:
-            await manager.disconnect(websocket, user.id)
-    except:
-        await websocket.close()
+    except Exception:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    finally:
+        # Only needed for the handshake; don't pin a pooled connection per socket
+        await db.close()
+
+    await manager.connect(websocket, user.id, message_format)
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get("text")
+            if data is None:
+                data = message.get("bytes")
+            await manager.handle_control_message(websocket, user.id, data)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await manager.disconnect(websocket, user.id)
 
 
 # Error handlers
@@ -0,0 +1,194 @@
+import os
+import re
+from typing import Optional, Tuple
+import aiofiles
+from fastapi import HTTPException, status
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response
+from app.config import settings
+
+MEDIA_URL_PREFIX = "/media/"
+CHUNK_SIZE = 256 * 1024
+# Blob and variant names are content hashes, so a URL never changes meaning
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+MEDIA_TYPES = {
+    ".jpg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".mp4": "video/mp4",
+    ".webm": "video/webm",
+}
+
+_MEDIA_PATH = re.compile(
+    r"blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(?:_\d+)?\.(?:jpg|png|gif|webp|mp4|webm)"
+)
+
+
+def media_url(path: str) -> str:
+    """Public URL for a file stored under ``settings.upload_dir``."""
+    relative = os.path.relpath(path, settings.upload_dir)
+    return MEDIA_URL_PREFIX + relative.replace(os.sep, "/")
+
+
+def media_path(relative: str) -> str:
+    """Filesystem path for a media URL path, or 404.
+
+    Only content-addressed blobs and their variants are served, which also
+    rules out traversal and temp files.
+    """
+    if not _MEDIA_PATH.fullmatch(relative):
+        raise HTTPException(status_code=404, detail="File not found")
+    path = os.path.join(settings.upload_dir, *relative.split("/"))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    return path
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` range into inclusive (start, end).
+
+    Returns None for headers we don't handle (other units, multiple ranges,
+    malformed values), which means the whole file is sent.
+    """
+    units, _, spec = header.partition("=")
+    if units.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+            return max(0, size - suffix), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in [tag.removeprefix("W/") for tag in candidates]
+
+
+class MediaFileResponse(Response):
+    """Serve a content-addressed file with conditional and Range support.
+
+    The ETag is the file's name, i.e. its content hash. Bodies go out through
+    the ASGI zero-copy extension when the server offers it, and in chunks
+    otherwise.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        name, extension = os.path.splitext(os.path.basename(path))
+        self.etag = f'"{name}"'
+        self.media_type = MEDIA_TYPES.get(extension, "application/octet-stream")
+        self.background = None
+        self.status_code = status.HTTP_200_OK
+        self.init_headers(
+            {
+                "accept-ranges": "bytes",
+                "cache-control": IMMUTABLE_CACHE_CONTROL,
+                "etag": self.etag,
+            }
+        )
+
+    async def __call__(self, scope, receive, send):
+        request_headers = Headers(scope=scope)
+        size = os.stat(self.path).st_size
+
+        if etag_matches(request_headers.get("if-none-match", ""), self.etag):
+            await self._send_headers(send, status.HTTP_304_NOT_MODIFIED)
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        start, end = 0, size - 1
+        status_code = status.HTTP_200_OK
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and (if_range is None or if_range == self.etag):
+            try:
+                requested = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                await self._send_headers(
+                    send,
+                    status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                    {"content-range": f"bytes */{size}", "content-length": "0"},
+                )
+                await send({"type": "http.response.body", "body": b""})
+                return
+            if requested is not None:
+                start, end = requested
+                status_code = status.HTTP_206_PARTIAL_CONTENT
+
+        length = end - start + 1 if size else 0
+        extra = {"content-length": str(length)}
+        if status_code == status.HTTP_206_PARTIAL_CONTENT:
+            extra["content-range"] = f"bytes {start}-{end}/{size}"
+        await self._send_headers(send, status_code, extra)
+
+        if scope["method"] == "HEAD" or length == 0:
+            await send({"type": "http.response.body", "body": b""})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": file,
+                        "offset": start,
+                        "count": length,
+                    }
+                )
+        else:
+            async with aiofiles.open(self.path, "rb") as file:
+                await file.seek(start)
+                remaining = length
+                while remaining:
+                    chunk = await file.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": chunk,
+                            "more_body": remaining > 0,
+                        }
+                    )
+                if remaining:
+                    # The file shrank underneath us; end the response anyway
+                    await send({"type": "http.response.body", "body": b""})
+
+    async def _send_headers(self, send, status_code: int, extra: dict = None):
+        headers = list(self.raw_headers)
+        for key, value in (extra or {}).items():
+            headers.append((key.encode("latin-1"), value.encode("latin-1")))
+        await send(
+            {"type": "http.response.start", "status": status_code, "headers": headers}
+        )
+
+
+class MediaGZipMiddleware(GZipMiddleware):
+    """GZip that leaves media alone: it is already compressed, and the
+    compressor would swallow zero-copy sends."""
+
+    def __init__(self, app, exclude_prefixes=(MEDIA_URL_PREFIX,), **kwargs):
+        super().__init__(app, **kwargs)
+        self.exclude_prefixes = tuple(exclude_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.exclude_prefixes):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
@@ -1,4 +1,13 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Table, Boolean
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    ForeignKey,
+    DateTime,
+    Table,
+    Boolean,
+    Index,
+)
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -9,6 +18,32 @@ likes = Table(
     Base.metadata,
     Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
     Column("post_id", Integer, ForeignKey("posts.id"), primary_key=True),
+    # Likers of a post are listed and counted by post_id
+    Index("ix_likes_post_id_user_id", "post_id", "user_id"),
+)
+
+# Who follows whom; the primary key lists a user's followees
+follows = Table(
+    "follows",
+    Base.metadata,
+    Column("follower_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("followee_id", Integer, ForeignKey("users.id"), primary_key=True),
+    # Fan-out on write reads an author's followers
+    Index("ix_follows_followee_id_follower_id", "followee_id", "follower_id"),
+)
+
+# Materialized home timelines: one row per post pushed to a follower
+timeline = Table(
+    "timeline",
+    Base.metadata,
+    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("post_id", Integer, ForeignKey("posts.id"), primary_key=True),
+    Column("author_id", Integer, ForeignKey("users.id"), nullable=False),
+    # Copied from the post so a page is a range scan of one index
+    Column("created_at", DateTime, nullable=False),
+    Index("ix_timeline_user_id_created_at_post_id", "user_id", "created_at", "post_id"),
+    # Deleting a post removes it from every timeline
+    Index("ix_timeline_post_id", "post_id"),
 )
 
 
@@ -20,6 +55,8 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     password_hash = Column(String)
     is_admin = Column(Boolean, default=False)
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
+    followers_count = Column(Integer, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -35,6 +72,8 @@ class Post(Base):
     content = Column(String)
     image_url = Column(String, nullable=True)
     author_id = Column(Integer, ForeignKey("users.id"))
+    likes_count = Column(Integer, default=0, server_default="0", nullable=False)
+    comments_count = Column(Integer, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -44,6 +83,13 @@ class Post(Base):
     )
     liked_by = relationship("User", secondary=likes, back_populates="liked_posts")
 
+    __table_args__ = (
+        # Keyset pagination seeks on (created_at, id)
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        # A user's own posts, newest last, and the author foreign key
+        Index("ix_posts_author_id_created_at_id", "author_id", "created_at", "id"),
+    )
+
 
 class Comment(Base):
     __tablename__ = "comments"
@@ -57,3 +103,48 @@ class Comment(Base):
 
     author = relationship("User", back_populates="comments")
     post = relationship("Post", back_populates="comments")
+
+    __table_args__ = (
+        Index("ix_comments_post_id_created_at_id", "post_id", "created_at", "id"),
+        Index("ix_comments_author_id", "author_id"),
+    )
+
+
+class MediaBlob(Base):
+    """One stored file, shared by every upload with the same content."""
+
+    __tablename__ = "media_blobs"
+
+    sha256 = Column(String, primary_key=True)
+    extension = Column(String)
+    size = Column(Integer)
+    ref_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # None for files without variants, else pending/ready/failed
+    variants_status = Column(String)
+    # Failed renders, retried with backoff up to image_variant_max_attempts
+    variants_attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    variants_attempted_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    variants = relationship("MediaVariant", order_by="MediaVariant.width")
+
+
+class MediaFile(Base):
+    __tablename__ = "media_files"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    sha256 = Column(String, ForeignKey("media_blobs.sha256"), index=True)
+    filename = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    blob = relationship("MediaBlob")
+
+
+class MediaVariant(Base):
+    __tablename__ = "media_variants"
+
+    sha256 = Column(String, ForeignKey("media_blobs.sha256"), primary_key=True)
+    width = Column(Integer, primary_key=True)
+    height = Column(Integer)
+    size = Column(Integer)
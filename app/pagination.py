@@ -0,0 +1,82 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode(values: list) -> str:
+    raw = json.dumps(values, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> list:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded))
+
+
+def _invalid_cursor():
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+    )
+
+
+def _row_id(value) -> int:
+    # Anything else would fail, or overflow, only once it reaches the query
+    if type(value) is not int or not 0 <= value < 2**63:
+        raise ValueError("row id out of range")
+    return value
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    return _encode([created_at.isoformat(), row_id])
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, row_id = _decode(cursor)
+        return datetime.fromisoformat(created_at), _row_id(row_id)
+    except (ValueError, TypeError, OverflowError):
+        raise _invalid_cursor()
+
+
+def encode_id_cursor(row_id: int) -> str:
+    return _encode([row_id])
+
+
+def decode_id_cursor(cursor: str) -> int:
+    try:
+        (row_id,) = _decode(cursor)
+        return _row_id(row_id)
+    except (ValueError, TypeError, OverflowError):
+        raise _invalid_cursor()
+
+
+def keyset_page(
+    query, created_col, id_col, cursor: Optional[str], limit: int, skip: int = 0
+):
+    """Return one page of ``query`` ordered by ``(created_col, id_col)``.
+
+    With a cursor the query seeks past the last row of the previous page
+    through the composite index instead of counting skipped rows, so every
+    page costs the same. ``skip`` is only kept for older clients. Returns the
+    rows and the cursor for the next page (``None`` on the last page).
+    """
+    if limit <= 0:
+        return [], None
+    if cursor is not None:
+        query = query.filter(tuple_(created_col, id_col) > decode_cursor(cursor))
+    query = query.order_by(created_col, id_col)
+    if skip:
+        query = query.offset(skip)
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(
+        getattr(last, created_col.key), getattr(last, id_col.key)
+    )
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import is_recent_writer
+from app.events import event_bus, on_commit
+from app.media import etag_matches
+from app.metrics import metrics
+from app.websocket_manager import manager
+
+# Reads need a token, so shared caches must not keep them; browsers revalidate
+CACHE_CONTROL = "private, no-cache"
+
+POSTS_TAG = "posts"
+
+
+def post_tag(post_id: int) -> str:
+    """Anything that shows this post or its counters."""
+    return f"post:{post_id}"
+
+
+def comments_tag(post_id: int) -> str:
+    """Pages of this post's comments."""
+    return f"comments:{post_id}"
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "headers", "tags", "expires_at")
+
+    def __init__(self, body: bytes, headers: Dict[str, str], tags: Iterable[str]):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.headers = headers
+        self.tags = frozenset(tags)
+        self.expires_at = 0.0
+
+    def to_response(self, request: Request) -> Response:
+        headers = {"etag": self.etag, "cache-control": CACHE_CONTROL}
+        if etag_matches(request.headers.get("if-none-match", ""), self.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(
+            self.body,
+            media_type="application/json",
+            headers={**headers, **self.headers},
+        )
+
+
+class ResponseCache:
+    """Thread-safe LRU of serialized responses, bounded by total body size.
+
+    Entries are tagged with the rows they were built from and ``invalidate``
+    drops every entry carrying a tag. Invalidations advance ``version`` and
+    stamp their tags with it; a response built from a ``version`` older
+    than one of its tags' stamps may already be stale, so ``set`` refuses
+    it. Only the latest ``max_tags`` stamps are kept, and anything built
+    before the oldest forgotten one is refused too. Entries also expire
+    after ``ttl`` seconds, which bounds how long a lagging read replica or a
+    lost relayed invalidation can be served from here.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, max_tags: int = 100_000):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_tags = max_tags
+        self.version = 0
+        self.size = 0
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._tags: Dict[str, Set[Hashable]] = {}
+        self._invalidated: "OrderedDict[str, int]" = OrderedDict()
+        self._forgotten = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._discard(key)
+                entry = None
+            if entry is None:
+                metrics.incr("response_cache.misses")
+                return None
+            self._entries.move_to_end(key)
+        metrics.incr("response_cache.hits")
+        return entry
+
+    def set(self, key: Hashable, entry: CachedResponse, version: int) -> bool:
+        """Store ``entry`` unless it is too big or was built before the
+        latest invalidation (``version`` is the value read beforehand)."""
+        if self.ttl <= 0 or len(entry.body) > self.max_bytes:
+            return False
+        with self._lock:
+            if version < self._forgotten or any(
+                self._invalidated.get(tag, 0) > version for tag in entry.tags
+            ):
+                return False
+            self._discard(key)
+            entry.expires_at = time.monotonic() + self.ttl
+            self._entries[key] = entry
+            self.size += len(entry.body)
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                metrics.incr("response_cache.evictions")
+            metrics.set_gauge("response_cache.bytes", self.size)
+        return True
+
+    def invalidate(self, *tags: str):
+        with self._lock:
+            self.version += 1
+            for tag in tags:
+                self._invalidated[tag] = self.version
+                self._invalidated.move_to_end(tag)
+                for key in self._tags.pop(tag, ()):
+                    self._discard(key)
+            while len(self._invalidated) > self.max_tags:
+                _, stamp = self._invalidated.popitem(last=False)
+                self._forgotten = max(self._forgotten, stamp)
+            metrics.set_gauge("response_cache.bytes", self.size)
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._forgotten = self.version
+            self._entries.clear()
+            self._tags.clear()
+            self._invalidated.clear()
+            self.size = 0
+
+    def _discard(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= len(entry.body)
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+response_cache = ResponseCache(
+    max_bytes=settings.response_cache_max_bytes,
+    ttl=settings.response_cache_ttl_seconds,
+)
+
+
+INVALIDATE_TOPIC = "cache:invalidate"
+
+
+def _apply_relayed_invalidation(message: str):
+    response_cache.invalidate(*json.loads(message))
+    metrics.incr("response_cache.relayed_invalidations")
+
+
+manager.on_relay(INVALIDATE_TOPIC, _apply_relayed_invalidation)
+
+
+def invalidate_everywhere(*tags: str):
+    """Invalidate here at once, then in the other workers via the backplane."""
+    response_cache.invalidate(*tags)
+    event_bus.relay(INVALIDATE_TOPIC, json.dumps(tags))
+
+
+def cached_json(
+    request: Request,
+    key: Hashable,
+    adapter: TypeAdapter,
+    build: Callable[[], Tuple[object, Dict[str, str], Iterable[str]]],
+) -> Response:
+    """Answer from the cache, or call ``build`` for ``(content, headers,
+    tags)``, serialize ``content`` with ``adapter`` and cache the result.
+
+    A matching ``If-None-Match`` on a cached entry gets a 304 without
+    ``build`` ever running. Callers who just wrote skip the cached copy, as
+    another worker may not have seen their invalidation yet.
+    """
+    entry = None if is_recent_writer(request) else response_cache.get(key)
+    if entry is None:
+        version = response_cache.version
+        content, headers, tags = build()
+        body = adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+        entry = CachedResponse(body, headers, tags)
+        response_cache.set(key, entry, version)
+    return entry.to_response(request)
+
+
+def invalidate(db: Session, *tags: str):
+    """Drop cached responses carrying ``tags`` in every worker once ``db``
+    commits."""
+    on_commit(db, invalidate_everywhere, *tags)
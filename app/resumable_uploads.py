@@ -0,0 +1,223 @@
+import asyncio
+import fcntl
+import json
+import os
+import re
+import secrets
+import time
+from datetime import datetime
+from typing import AsyncIterator, Optional
+import aiofiles
+from fastapi import HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import ClientDisconnect
+from app import schemas
+from app.config import settings
+from app.file_handler import save_local_file
+from app.metrics import metrics
+
+UPLOAD_OFFSET_HEADER = "Upload-Offset"
+UPLOAD_LENGTH_HEADER = "Upload-Length"
+
+_UPLOAD_ID = re.compile(r"[0-9a-f]{32}")
+
+
+def _state_dir() -> str:
+    return os.path.join(settings.upload_dir, ".resumable")
+
+
+def _part_path(upload_id: str) -> str:
+    return os.path.join(_state_dir(), upload_id + ".part")
+
+
+def _meta_path(upload_id: str) -> str:
+    return os.path.join(_state_dir(), upload_id + ".json")
+
+
+def _not_found() -> HTTPException:
+    return HTTPException(status_code=404, detail="Upload not found")
+
+
+def _conflict(detail: str, offset: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=detail,
+        headers={UPLOAD_OFFSET_HEADER: str(offset)},
+    )
+
+
+def _describe(upload_id: str, meta: dict, offset: int) -> schemas.ResumableUpload:
+    return schemas.ResumableUpload(
+        id=upload_id,
+        filename=meta["filename"],
+        size=meta["size"],
+        offset=offset,
+        expires_at=datetime.utcfromtimestamp(
+            os.path.getmtime(_part_path(upload_id))
+            + settings.resumable_upload_ttl_seconds
+        ),
+    )
+
+
+def _load(upload_id: str, user_id: int) -> dict:
+    if not _UPLOAD_ID.fullmatch(upload_id):
+        raise _not_found()
+    try:
+        with open(_meta_path(upload_id)) as meta_file:
+            meta = json.load(meta_file)
+    except FileNotFoundError:
+        raise _not_found()
+    if meta["user_id"] != user_id or not os.path.exists(_part_path(upload_id)):
+        raise _not_found()
+    return meta
+
+
+class _LockedPart:
+    """Open a session's data file for appending, holding an exclusive lock so
+    two requests (even from different workers) can't write it at once."""
+
+    def __init__(self, upload_id: str):
+        self.path = _part_path(upload_id)
+
+    def __enter__(self) -> int:
+        try:
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        except FileNotFoundError:
+            raise _not_found()
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(self.fd)
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Another request is writing to this upload",
+            )
+        return self.fd
+
+    def __exit__(self, *exc_info):
+        os.close(self.fd)
+
+
+def create_upload(user_id: int, filename: str, size: int) -> schemas.ResumableUpload:
+    if size <= 0:
+        raise HTTPException(status_code=400, detail="Upload size must be positive")
+    if size > settings.max_upload_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Maximum size is {settings.max_upload_size} bytes",
+        )
+    os.makedirs(_state_dir(), exist_ok=True)
+    upload_id = secrets.token_hex(16)
+    meta = {
+        "user_id": user_id,
+        "filename": os.path.basename(filename),
+        "size": size,
+        "created_at": time.time(),
+    }
+    with open(_meta_path(upload_id), "w") as meta_file:
+        json.dump(meta, meta_file)
+    open(_part_path(upload_id), "wb").close()
+    metrics.incr("resumable_uploads.created")
+    return _describe(upload_id, meta, 0)
+
+
+def get_upload(upload_id: str, user_id: int) -> schemas.ResumableUpload:
+    meta = _load(upload_id, user_id)
+    return _describe(upload_id, meta, os.path.getsize(_part_path(upload_id)))
+
+
+async def append_chunk(
+    upload_id: str, user_id: int, offset: int, chunks: AsyncIterator[bytes]
+) -> int:
+    """Append a request body at ``offset`` and return the new offset.
+
+    ``offset`` must match what the server already has. Bytes received before a
+    dropped connection are kept, so the client resumes from there.
+    """
+    meta = _load(upload_id, user_id)
+    with _LockedPart(upload_id) as fd:
+        current = os.fstat(fd).st_size
+        if offset != current:
+            raise _conflict("Upload-Offset does not match the stored offset", current)
+        async with aiofiles.open(fd, "ab", closefd=False) as out_file:
+            try:
+                async for chunk in chunks:
+                    if current + len(chunk) > meta["size"]:
+                        raise _conflict("Chunk runs past the declared size", current)
+                    await out_file.write(chunk)
+                    await out_file.flush()
+                    current += len(chunk)
+            except ClientDisconnect:
+                metrics.incr("resumable_uploads.interrupted")
+    return current
+
+
+async def complete_upload(
+    upload_id: str, user_id: int, db: AsyncSession
+) -> schemas.MediaFile:
+    """Validate and store a fully received upload, then drop its session.
+
+    The data goes through the same checks and content-addressed storage as
+    a regular upload; a file that fails them ends the session.
+    """
+    meta = _load(upload_id, user_id)
+    with _LockedPart(upload_id) as fd:
+        current = os.fstat(fd).st_size
+        if current != meta["size"]:
+            raise _conflict("Upload is incomplete", current)
+        try:
+            stored = await save_local_file(
+                _part_path(upload_id), meta["filename"], user_id, db
+            )
+        finally:
+            _remove(_meta_path(upload_id))
+    metrics.incr("resumable_uploads.completed")
+    return stored
+
+
+def cancel_upload(upload_id: str, user_id: int):
+    _load(upload_id, user_id)
+    _remove(_part_path(upload_id))
+    _remove(_meta_path(upload_id))
+
+
+def collect_expired_uploads(now: Optional[float] = None) -> int:
+    """Remove sessions idle for longer than the TTL; returns how many."""
+    if now is None:
+        now = time.time()
+    try:
+        names = os.listdir(_state_dir())
+    except FileNotFoundError:
+        return 0
+
+    expired = 0
+    for upload_id in {os.path.splitext(name)[0] for name in names}:
+        paths = [_part_path(upload_id), _meta_path(upload_id)]
+        try:
+            last_active = max(os.path.getmtime(p) for p in paths if os.path.exists(p))
+        except ValueError:
+            continue
+        if now - last_active > settings.resumable_upload_ttl_seconds:
+            for path in paths:
+                _remove(path)
+            expired += 1
+    if expired:
+        metrics.incr("resumable_uploads.expired", expired)
+    return expired
+
+
+async def collect_expired_uploads_forever():
+    """Background task started with the app."""
+    while True:
+        await asyncio.sleep(settings.resumable_upload_gc_interval_seconds)
+        try:
+            await asyncio.to_thread(collect_expired_uploads)
+        except OSError:
+            metrics.incr("resumable_uploads.gc_errors")
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
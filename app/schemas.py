@@ -67,7 +67,57 @@ class Comment(CommentBase):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 
 class TokenData(BaseModel):
     user_name: Optional[str] = None
+
+
+class TokenClaims(BaseModel):
+    id: int
+    user_name: Optional[str] = None
+    is_admin: bool = False
+    token_version: int = 0
+
+
+class MediaFile(BaseModel):
+    id: int
+    filename: str
+    sha256: str
+    size: int
+    location: str
+    url: str
+    variants_status: Optional[str] = None
+
+
+class MediaVariant(BaseModel):
+    width: int
+    height: int
+    size: int
+    location: str
+    url: str
+
+
+class MediaVariants(BaseModel):
+    id: int
+    sha256: str
+    status: Optional[str] = None
+    variants: List[MediaVariant] = []
+
+
+class ResumableUploadCreate(BaseModel):
+    filename: str
+    size: int
+
+
+class ResumableUpload(BaseModel):
+    id: str
+    filename: str
+    size: int
+    offset: int
+    expires_at: datetime
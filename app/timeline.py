@@ -0,0 +1,204 @@
+from typing import List, Optional, Tuple
+from sqlalchemy import DateTime, insert, literal, select, tuple_
+from sqlalchemy.orm import Session, selectinload
+import app.models as models
+from app.config import settings
+from app.database import bump_counter, upsert_insert
+from app.metrics import metrics
+from app.pagination import decode_cursor, encode_cursor
+
+follows = models.follows
+timeline = models.timeline
+
+TIMELINE_COLUMNS = ["user_id", "post_id", "author_id", "created_at"]
+
+
+def fans_out(followers_count: int) -> bool:
+    """Whether an author's posts are pushed to followers when written.
+
+    Authors above ``timeline_fanout_max_followers`` would cost one row per
+    follower per post; their posts are pulled when timelines are read.
+    """
+    return followers_count <= settings.timeline_fanout_max_followers
+
+
+def fan_out(db: Session, post: models.Post) -> int:
+    """Add a new post to its author's timeline and, unless the author has
+    too many followers, to every follower's in a single INSERT ... SELECT.
+    Returns the number of follower timelines written."""
+    db.execute(
+        insert(timeline).values(
+            user_id=post.author_id,
+            post_id=post.id,
+            author_id=post.author_id,
+            created_at=post.created_at,
+        )
+    )
+    followers_count = (
+        db.query(models.User.followers_count)
+        .filter(models.User.id == post.author_id)
+        .scalar()
+    )
+    if not followers_count or not fans_out(followers_count):
+        return 0
+    followers = select(
+        follows.c.follower_id,
+        literal(post.id),
+        literal(post.author_id),
+        literal(post.created_at, DateTime),
+    ).where(follows.c.followee_id == post.author_id)
+    result = db.execute(insert(timeline).from_select(TIMELINE_COLUMNS, followers))
+    metrics.incr("timeline.fanned_out", result.rowcount)
+    return result.rowcount
+
+
+def remove_post(db: Session, post_id: int):
+    db.execute(timeline.delete().where(timeline.c.post_id == post_id))
+
+
+def _backfill(db: Session, author_id: int, follower_id: Optional[int] = None):
+    """Copy the author's most recent posts into followers' timelines.
+
+    Only ``follower_id``'s timeline when given, otherwise every follower's.
+    """
+    recent = (
+        select(models.Post.id, models.Post.author_id, models.Post.created_at)
+        .where(models.Post.author_id == author_id)
+        .order_by(models.Post.created_at.desc(), models.Post.id.desc())
+        .limit(settings.timeline_backfill_posts)
+        .subquery()
+    )
+    followers = (
+        select(
+            follows.c.follower_id, recent.c.id, recent.c.author_id, recent.c.created_at
+        )
+        .join_from(follows, recent, recent.c.author_id == follows.c.followee_id)
+        .where(follows.c.followee_id == author_id)
+    )
+    if follower_id is not None:
+        followers = followers.where(follows.c.follower_id == follower_id)
+    db.execute(
+        upsert_insert(db, timeline)
+        .from_select(TIMELINE_COLUMNS, followers)
+        .on_conflict_do_nothing()
+    )
+
+
+def follow(db: Session, follower_id: int, followee_id: int) -> bool:
+    """Insert a follow, doing nothing if it is already there.
+
+    The followee's recent posts are copied into the follower's timeline when
+    they would have been fanned out; otherwise reads pull them anyway.
+    """
+    result = db.execute(
+        upsert_insert(db, follows)
+        .values(follower_id=follower_id, followee_id=followee_id)
+        .on_conflict_do_nothing()
+    )
+    if result.rowcount != 1:
+        return False
+    followers_count = bump_counter(
+        db, models.User, followee_id, models.User.followers_count, 1
+    )
+    if fans_out(followers_count) and settings.timeline_backfill_posts > 0:
+        _backfill(db, followee_id, follower_id)
+    return True
+
+
+def unfollow(db: Session, follower_id: int, followee_id: int) -> bool:
+    result = db.execute(
+        follows.delete().where(
+            follows.c.follower_id == follower_id, follows.c.followee_id == followee_id
+        )
+    )
+    if result.rowcount != 1:
+        return False
+    followers_count = bump_counter(
+        db, models.User, followee_id, models.User.followers_count, -1
+    )
+    # Posts written while the followee was pulled were never fanned out, and
+    # reads stop pulling them now
+    if (
+        fans_out(followers_count)
+        and not fans_out(followers_count + 1)
+        and settings.timeline_backfill_posts > 0
+    ):
+        _backfill(db, followee_id)
+    db.execute(
+        timeline.delete().where(
+            timeline.c.user_id == follower_id, timeline.c.author_id == followee_id
+        )
+    )
+    return True
+
+
+def _pulled_authors(db: Session, user_id: int) -> List[int]:
+    """Followees whose posts are not fanned out to this user."""
+    return list(
+        db.scalars(
+            select(follows.c.followee_id)
+            .join(models.User, models.User.id == follows.c.followee_id)
+            .where(
+                follows.c.follower_id == user_id,
+                models.User.followers_count > settings.timeline_fanout_max_followers,
+            )
+        )
+    )
+
+
+def _newest_first(query, created_col, id_col, before, limit: int):
+    if before is not None:
+        query = query.where(tuple_(created_col, id_col) < before)
+    return query.order_by(created_col.desc(), id_col.desc()).limit(limit)
+
+
+def timeline_page(
+    db: Session, user_id: int, cursor: Optional[str], limit: int
+) -> Tuple[List[models.Post], Optional[str]]:
+    """One page of ``user_id``'s home timeline, newest first.
+
+    The materialized rows come from one range scan of the
+    ``(user_id, created_at, post_id)`` index. Posts by followees with too
+    many followers to fan out are read from their authors' post index and
+    merged in. Returns the posts and the cursor for the next page.
+    """
+    before = decode_cursor(cursor) if cursor is not None else None
+    keys = set(
+        db.execute(
+            _newest_first(
+                select(timeline.c.created_at, timeline.c.post_id).where(
+                    timeline.c.user_id == user_id
+                ),
+                timeline.c.created_at,
+                timeline.c.post_id,
+                before,
+                limit + 1,
+            )
+        ).tuples()
+    )
+    pulled = _pulled_authors(db, user_id)
+    if pulled:
+        keys.update(
+            db.execute(
+                _newest_first(
+                    select(models.Post.created_at, models.Post.id).where(
+                        models.Post.author_id.in_(pulled)
+                    ),
+                    models.Post.created_at,
+                    models.Post.id,
+                    before,
+                    limit + 1,
+                )
+            ).tuples()
+        )
+
+    keys = sorted(keys, reverse=True)
+    page = keys[:limit]
+    next_cursor = encode_cursor(*page[-1]) if len(keys) > limit else None
+    posts = {
+        post.id: post
+        for post in db.query(models.Post)
+        .options(selectinload(models.Post.author))
+        .filter(models.Post.id.in_([post_id for _, post_id in page]))
+    }
+    return [posts[post_id] for _, post_id in page if post_id in posts], next_cursor
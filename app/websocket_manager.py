@@ -1,33 +1,421 @@
-from fastapi import WebSocket
-from typing import List, Dict
+import asyncio
 import json
+import re
+import time
+import msgpack
+from fastapi import WebSocket, status
+from typing import Callable, List, Dict, Optional, Set
+from app.backplane import Backplane, create_backplane
+from app.config import settings
+from app.metrics import metrics
+
+OVERFLOW_DISCONNECT = "disconnect"
+OVERFLOW_DROP = "drop"
+
+FORMAT_JSON = "json"
+FORMAT_MSGPACK = "msgpack"
+
+FEED_TOPIC = "feed"
+_TOPIC = re.compile(r"(post|user):(\d+)|feed")
+
+
+def post_topic(post_id: int) -> str:
+    """New comments and like counts for one post."""
+    return f"post:{post_id}"
+
+
+def user_topic(user_id: int) -> str:
+    """Notifications for one user; every socket joins its own on connect."""
+    return f"user:{user_id}"
+
+
+def topic_error(topic, user_id: int) -> Optional[str]:
+    """Why ``user_id`` may not subscribe to ``topic``, or None if it may."""
+    match = _TOPIC.fullmatch(topic) if isinstance(topic, str) else None
+    if match is None:
+        return "Unknown topic"
+    if match.group(1) == "user" and int(match.group(2)) != user_id:
+        return "Not allowed to subscribe to this topic"
+    return None
+
+
+class OutboundMessage:
+    """One message on its way to any number of sockets.
+
+    Publishers hand over JSON text. The MessagePack form is built from it the
+    first time a binary client needs it and then shared by every recipient,
+    so a broadcast is encoded once per format, not once per socket.
+    """
+
+    __slots__ = ("text", "_packed")
+
+    def __init__(self, text: str):
+        self.text = text
+        self._packed: Optional[bytes] = None
+
+    def packed(self) -> bytes:
+        if self._packed is None:
+            try:
+                payload = json.loads(self.text)
+            except ValueError:
+                payload = self.text
+            self._packed = msgpack.packb(payload)
+        return self._packed
+
+
+def pack_batch(messages: List[OutboundMessage]) -> bytes:
+    """A MessagePack array of ``messages``, reusing each one's encoding."""
+    count = len(messages)
+    if count < 16:
+        header = bytes([0x90 | count])
+    elif count < 0x10000:
+        header = b"\xdc" + count.to_bytes(2, "big")
+    else:
+        header = b"\xdd" + count.to_bytes(4, "big")
+    return header + b"".join(message.packed() for message in messages)
+
+
+class _Connection:
+    """One socket's outbound queue and the task that drains it."""
+
+    # Tens of thousands of these stay alive at once
+    __slots__ = (
+        "websocket",
+        "user_id",
+        "format",
+        "queue",
+        "writer",
+        "topics",
+        "last_seen",
+    )
+
+    def __init__(
+        self, websocket: WebSocket, user_id: int, max_queue_size: int, format: str
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.format = format
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self.writer: asyncio.Task = None
+        self.topics: Set[str] = set()
+        self.last_seen = time.monotonic()
 
 
 class ConnectionManager:
-    def __init__(self):
+    """Tracks open sockets per user and per topic and delivers messages to them.
+
+    ``topics`` maps each topic to its subscribed connections, so publishing
+    only touches interested sockets. Every connection gets a bounded queue
+    and its own writer task, so sending never waits on a client: a slow
+    socket only backs up its own queue. When a queue is full the message is
+    dropped or the connection is closed, depending on ``overflow_policy``.
+
+    While started, a single heartbeat task pings every socket each
+    ``ping_interval`` seconds and closes those that have sent nothing for
+    ``idle_timeout`` seconds, so half-open connections do not pile up.
+
+    Sockets speak JSON (one message per text frame) or MessagePack, chosen
+    at connect. MessagePack sockets get binary frames holding an array of
+    every message queued within ``batch_window`` seconds, up to
+    ``batch_size`` messages.
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int = None,
+        overflow_policy: str = None,
+        close_timeout: float = 1.0,
+        backplane: Backplane = None,
+        ping_interval: float = None,
+        idle_timeout: float = None,
+        max_connections_per_user: int = None,
+        batch_window: float = None,
+        batch_size: int = None,
+    ):
         self.active_connections: Dict[int, List[WebSocket]] = {}
+        self.max_queue_size = max_queue_size or settings.websocket_send_queue_size
+        self.overflow_policy = overflow_policy or settings.websocket_overflow_policy
+        self.close_timeout = close_timeout
+        self.backplane = backplane or create_backplane()
+        self.ping_interval = ping_interval or settings.websocket_ping_interval_seconds
+        self.idle_timeout = idle_timeout or settings.websocket_idle_timeout_seconds
+        self.max_connections_per_user = (
+            max_connections_per_user or settings.websocket_max_connections_per_user
+        )
+        self.batch_window = (
+            settings.websocket_batch_window_seconds
+            if batch_window is None
+            else batch_window
+        )
+        self.batch_size = batch_size or settings.websocket_batch_max_messages
+        self.topics: Dict[str, Set[_Connection]] = {}
+        self._connections: Dict[WebSocket, _Connection] = {}
+        self._queued = 0
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._closing: Set[asyncio.Task] = set()
+        self._relay_handlers: Dict[str, Callable[[str], object]] = {}
+
+    async def start(self):
+        await self.backplane.start(self.deliver)
+        self._heartbeat = asyncio.create_task(self._heartbeat_forever())
 
-    async def connect(self, websocket: WebSocket, user_id: int):
+    async def stop(self):
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        await self.backplane.stop()
+
+    async def connect(
+        self, websocket: WebSocket, user_id: int, format: str = FORMAT_JSON
+    ):
         await websocket.accept()
+        connection = _Connection(websocket, user_id, self.max_queue_size, format)
+        connection.writer = asyncio.create_task(self._write(connection))
+        self._connections[websocket] = connection
         if user_id not in self.active_connections:
             self.active_connections[user_id] = []
         self.active_connections[user_id].append(websocket)
+        self.subscribe(websocket, user_topic(user_id))
+        metrics.set_gauge("websocket.connections", len(self._connections))
+        # Over the limit the user's oldest socket makes room for the new one
+        user_connections = self.active_connections[user_id]
+        while len(user_connections) > self.max_connections_per_user:
+            oldest = self._connections[user_connections[0]]
+            self._drop(oldest, status.WS_1008_POLICY_VIOLATION)
+            metrics.incr("websocket.evicted_connections")
 
     async def disconnect(self, websocket: WebSocket, user_id: int):
-        if user_id in self.active_connections:
-            self.active_connections[user_id].remove(websocket)
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
+        connection = self._remove(websocket)
+        if connection is not None and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+
+    def subscribe(self, websocket: WebSocket, topic: str) -> bool:
+        connection = self._connections.get(websocket)
+        if connection is None:
+            return False
+        if topic not in connection.topics:
+            if len(connection.topics) >= settings.websocket_max_subscriptions:
+                return False
+            connection.topics.add(topic)
+            self.topics.setdefault(topic, set()).add(connection)
+        return True
+
+    def unsubscribe(self, websocket: WebSocket, topic: str):
+        connection = self._connections.get(websocket)
+        if connection is not None and topic in connection.topics:
+            connection.topics.discard(topic)
+            self._leave(connection, topic)
+
+    def publish(self, topic: str, message: str) -> int:
+        """Queue ``message`` for every subscriber of ``topic`` in this worker
+        and relay it to the other workers; never blocks. Returns the number
+        of local subscribers."""
+        delivered = self._deliver(topic, OutboundMessage(message))
+        self.backplane.publish(topic, message)
+        metrics.incr("websocket.published")
+        return delivered
+
+    def deliver(self, topic: str, message: str) -> int:
+        """Queue ``message`` for this worker's subscribers of ``topic`` only.
+
+        Relayed messages on a topic registered with ``on_relay`` go to that
+        handler instead of to sockets.
+        """
+        handler = self._relay_handlers.get(topic)
+        if handler is not None:
+            handler(message)
+            return 0
+        return self._deliver(topic, OutboundMessage(message))
+
+    def on_relay(self, topic: str, handler: Callable[[str], object]):
+        """Hand messages other workers send on ``topic`` to ``handler``.
+
+        Lets other components share the backplane; clients can't subscribe
+        to these topics since ``topic_error`` rejects them.
+        """
+        self._relay_handlers[topic] = handler
+
+    def _deliver(self, topic: str, message: OutboundMessage) -> int:
+        subscribers = list(self.topics.get(topic, ()))
+        for connection in subscribers:
+            self._enqueue(connection, message)
+        return len(subscribers)
+
+    def send(self, websocket: WebSocket, message: str):
+        connection = self._connections.get(websocket)
+        if connection is not None:
+            self._enqueue(connection, OutboundMessage(message))
 
     async def send_personal_message(self, message: str, user_id: int):
-        if user_id in self.active_connections:
-            for connection in self.active_connections[user_id]:
-                await connection.send_text(message)
+        self.publish(user_topic(user_id), message)
 
     async def broadcast(self, message: str):
-        for user_connections in self.active_connections.values():
-            for connection in user_connections:
-                await connection.send_text(message)
+        """Send to every socket in this worker; not relayed."""
+        message = OutboundMessage(message)
+        for connection in list(self._connections.values()):
+            self._enqueue(connection, message)
+
+    def touch(self, websocket: WebSocket):
+        """Record that the client is still there."""
+        connection = self._connections.get(websocket)
+        if connection is not None:
+            connection.last_seen = time.monotonic()
+
+    def sweep(self, now: float = None) -> int:
+        """Close idle sockets and ping the rest; returns the number closed."""
+        now = time.monotonic() if now is None else now
+        ping = OutboundMessage(_reply("ping"))
+        closed = 0
+        for connection in list(self._connections.values()):
+            if now - connection.last_seen > self.idle_timeout:
+                self._drop(connection, status.WS_1001_GOING_AWAY)
+                metrics.incr("websocket.idle_disconnected")
+                closed += 1
+            else:
+                self._enqueue(connection, ping)
+        return closed
+
+    async def handle_control_message(self, websocket: WebSocket, user_id: int, raw):
+        """Apply one client control message and queue the reply.
+
+        Clients send ``{"action": "subscribe" | "unsubscribe", "topic": ...}``
+        and get back ``{"type": "subscribed" | "unsubscribed", "topic": ...}``
+        or ``{"type": "error", "detail": ...}``. ``{"action": "ping"}`` is
+        answered with ``{"type": "pong"}``; ``{"action": "pong"}`` answers the
+        server's pings. Any message counts as activity. Binary frames are
+        decoded as MessagePack.
+        """
+        self.touch(websocket)
+        try:
+            request = (
+                msgpack.unpackb(raw) if isinstance(raw, bytes) else json.loads(raw)
+            )
+            action = request["action"]
+            if action == "pong":
+                return
+            if action == "ping":
+                self.send(websocket, _reply("pong"))
+                return
+            topic = request["topic"]
+        except (ValueError, TypeError, KeyError, msgpack.UnpackException):
+            self.send(websocket, _reply("error", detail="Invalid control message"))
+            return
+
+        if action not in ("subscribe", "unsubscribe"):
+            self.send(websocket, _reply("error", detail="Unknown action"))
+            return
+        # Also rejects non-string topics, which can't be looked up at all
+        error = topic_error(topic, user_id)
+        if error is None and action == "subscribe":
+            if not self.subscribe(websocket, topic):
+                error = "Too many subscriptions"
+        elif error is None:
+            self.unsubscribe(websocket, topic)
+        if error:
+            self.send(websocket, _reply("error", detail=error, topic=topic))
+        else:
+            reply = "subscribed" if action == "subscribe" else "unsubscribed"
+            self.send(websocket, _reply(reply, topic=topic))
+
+    async def drain(self):
+        """Wait until every queued message has been handed to its socket."""
+        await asyncio.gather(
+            *(connection.queue.join() for connection in self._connections.values())
+        )
+
+    def _enqueue(self, connection: _Connection, message: OutboundMessage):
+        try:
+            connection.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            metrics.incr("websocket.dropped_messages")
+            if self.overflow_policy == OVERFLOW_DISCONNECT and self._drop(
+                connection, status.WS_1013_TRY_AGAIN_LATER
+            ):
+                metrics.incr("websocket.slow_consumers_disconnected")
+            return
+        self._set_queued(self._queued + 1)
+
+    def _drop(self, connection: _Connection, code: int) -> bool:
+        """Forget ``connection`` now and close its socket in the background."""
+        if self._remove(connection.websocket) is None:
+            return False
+        connection.writer.cancel()
+        task = asyncio.create_task(self._close(connection.websocket, code))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+        return True
+
+    async def _close(self, websocket: WebSocket, code: int):
+        try:
+            await asyncio.wait_for(websocket.close(code=code), self.close_timeout)
+        except Exception:
+            pass
+
+    async def _heartbeat_forever(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            self.sweep()
+
+    async def _write(self, connection: _Connection):
+        queue = connection.queue
+        websocket = connection.websocket
+        binary = connection.format == FORMAT_MSGPACK
+        try:
+            while True:
+                batch = [await queue.get()]
+                try:
+                    if binary:
+                        if self.batch_window:
+                            await asyncio.sleep(self.batch_window)
+                        while len(batch) < self.batch_size and not queue.empty():
+                            batch.append(queue.get_nowait())
+                        await websocket.send_bytes(pack_batch(batch))
+                    else:
+                        await websocket.send_text(batch[0].text)
+                except Exception:
+                    metrics.incr("websocket.send_errors")
+                    self._remove(websocket)
+                    return
+                finally:
+                    self._set_queued(self._queued - len(batch))
+                    for _ in batch:
+                        queue.task_done()
+                metrics.incr("websocket.frames_sent")
+        finally:
+            # Anything still queued is never sent; release it for drain()
+            while not queue.empty():
+                queue.get_nowait()
+                queue.task_done()
+                self._set_queued(self._queued - 1)
+
+    def _remove(self, websocket: WebSocket):
+        connection = self._connections.pop(websocket, None)
+        if connection is None:
+            return None
+        user_connections = self.active_connections.get(connection.user_id, [])
+        if websocket in user_connections:
+            user_connections.remove(websocket)
+            if not user_connections:
+                del self.active_connections[connection.user_id]
+        for topic in connection.topics:
+            self._leave(connection, topic)
+        metrics.set_gauge("websocket.connections", len(self._connections))
+        return connection
+
+    def _leave(self, connection: _Connection, topic: str):
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(connection)
+            if not subscribers:
+                del self.topics[topic]
+
+    def _set_queued(self, queued: int):
+        self._queued = queued
+        metrics.set_gauge("websocket.queued_messages", queued)
+
+
+def _reply(type_: str, **fields) -> str:
+    return json.dumps({"type": type_, **fields})
 
 
 manager = ConnectionManager()
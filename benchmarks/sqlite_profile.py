@@ -0,0 +1,102 @@
+"""Compare SQLite read/write throughput with and without the production profile.
+
+Usage: python benchmarks/sqlite_profile.py [--seconds 5] [--writers 4] [--readers 8]
+
+Each run uses a fresh temporary database, so it never touches data/social.db.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from app.database import Base, create_db_engine  # noqa: E402
+from app.models import Post, User  # noqa: E402
+
+
+def run(profile: str, seconds: float, writers: int, readers: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", profile)
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+        with Session() as db:
+            db.add(User(id=1, user_name="bench", email="bench@example.com"))
+            db.add_all(Post(content=f"seed {i}", author_id=1) for i in range(1000))
+            db.commit()
+
+        counts = {"writes": 0, "reads": 0, "errors": 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+
+        def count(key):
+            with lock:
+                counts[key] += 1
+
+        def writer():
+            with Session() as db:
+                while time.monotonic() < deadline:
+                    try:
+                        db.add(Post(content="bench", author_id=1))
+                        db.commit()
+                        count("writes")
+                    except OperationalError:
+                        db.rollback()
+                        count("errors")
+
+        def reader():
+            with Session() as db:
+                while time.monotonic() < deadline:
+                    try:
+                        db.execute(
+                            text(
+                                "SELECT id, content FROM posts "
+                                "ORDER BY created_at DESC, id DESC LIMIT 20"
+                            )
+                        ).all()
+                        db.rollback()
+                        count("reads")
+                    except OperationalError:
+                        db.rollback()
+                        count("errors")
+
+        threads = [threading.Thread(target=writer) for _ in range(writers)]
+        threads += [threading.Thread(target=reader) for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+    return {
+        "profile": profile,
+        "writes/s": counts["writes"] / seconds,
+        "reads/s": counts["reads"] / seconds,
+        "errors": counts["errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'profile':<12}{'writes/s':>12}{'reads/s':>12}{'errors':>8}")
+    for profile in ("default", "production"):
+        result = run(profile, args.seconds, args.writers, args.readers)
+        print(
+            f"{result['profile']:<12}{result['writes/s']:>12.0f}"
+            f"{result['reads/s']:>12.0f}{result['errors']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
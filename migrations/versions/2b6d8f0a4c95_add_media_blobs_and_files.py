@@ -0,0 +1,50 @@
+"""add media blobs and files
+
+Revision ID: 2b6d8f0a4c95
+Revises: a93f6c1e0b48
+Create Date: 2026-10-18 16:27:09.448213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2b6d8f0a4c95'
+down_revision: Union[str, None] = 'a93f6c1e0b48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('media_blobs',
+    sa.Column('sha256', sa.String(), nullable=False),
+    sa.Column('extension', sa.String(), nullable=True),
+    sa.Column('size', sa.Integer(), nullable=True),
+    sa.Column('ref_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    op.create_table('media_files',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('sha256', sa.String(), nullable=True),
+    sa.Column('filename', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['sha256'], ['media_blobs.sha256'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_media_files_sha256'), 'media_files', ['sha256'], unique=False)
+    op.create_index(op.f('ix_media_files_user_id'), 'media_files', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_media_files_user_id'), table_name='media_files')
+    op.drop_index(op.f('ix_media_files_sha256'), table_name='media_files')
+    op.drop_table('media_files')
+    op.drop_table('media_blobs')
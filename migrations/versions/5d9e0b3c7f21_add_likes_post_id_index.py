@@ -0,0 +1,28 @@
+"""add likes post_id index
+
+Revision ID: 5d9e0b3c7f21
+Revises: c41a7e9b2d13
+Create Date: 2026-10-18 11:20:05.917342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d9e0b3c7f21'
+down_revision: Union[str, None] = 'c41a7e9b2d13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_likes_post_id_user_id', 'likes', ['post_id', 'user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_likes_post_id_user_id', table_name='likes')
@@ -0,0 +1,38 @@
+"""add media variants
+
+Revision ID: 7c1e5f9a3b62
+Revises: 2b6d8f0a4c95
+Create Date: 2026-10-18 17:05:41.193027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e5f9a3b62'
+down_revision: Union[str, None] = '2b6d8f0a4c95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('media_variants',
+    sa.Column('sha256', sa.String(), nullable=False),
+    sa.Column('width', sa.Integer(), nullable=False),
+    sa.Column('height', sa.Integer(), nullable=True),
+    sa.Column('size', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['sha256'], ['media_blobs.sha256'], ),
+    sa.PrimaryKeyConstraint('sha256', 'width')
+    )
+    op.add_column('media_blobs', sa.Column('variants_status', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('media_blobs') as batch_op:
+        batch_op.drop_column('variants_status')
+    op.drop_table('media_variants')
@@ -0,0 +1,30 @@
+"""add author indexes
+
+Revision ID: a93f6c1e0b48
+Revises: e7b4a2c9d856
+Create Date: 2026-10-18 15:08:33.127904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a93f6c1e0b48'
+down_revision: Union[str, None] = 'e7b4a2c9d856'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_posts_author_id_created_at_id', 'posts', ['author_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_comments_author_id', 'comments', ['author_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_comments_author_id', table_name='comments')
+    op.drop_index('ix_posts_author_id_created_at_id', table_name='posts')
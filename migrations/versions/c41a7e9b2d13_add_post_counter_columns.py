@@ -0,0 +1,36 @@
+"""add post counter columns
+
+Revision ID: c41a7e9b2d13
+Revises: 8f2c1d4e5a70
+Create Date: 2026-10-18 10:02:17.284561
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41a7e9b2d13'
+down_revision: Union[str, None] = '8f2c1d4e5a70'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('posts', sa.Column('likes_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('posts', sa.Column('comments_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        "UPDATE posts SET "
+        "likes_count = (SELECT count(*) FROM likes WHERE likes.post_id = posts.id), "
+        "comments_count = (SELECT count(*) FROM comments WHERE comments.post_id = posts.id)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('comments_count')
+        batch_op.drop_column('likes_count')
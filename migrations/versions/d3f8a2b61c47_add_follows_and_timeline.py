@@ -0,0 +1,60 @@
+"""add follows and timeline
+
+Revision ID: d3f8a2b61c47
+Revises: 7c1e5f9a3b62
+Create Date: 2026-10-18 21:12:09.548311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3f8a2b61c47'
+down_revision: Union[str, None] = '7c1e5f9a3b62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('follows',
+    sa.Column('follower_id', sa.Integer(), nullable=False),
+    sa.Column('followee_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['followee_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['follower_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('follower_id', 'followee_id')
+    )
+    op.create_index('ix_follows_followee_id_follower_id', 'follows', ['followee_id', 'follower_id'], unique=False)
+    op.create_table('timeline',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['author_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'post_id')
+    )
+    op.create_index('ix_timeline_post_id', 'timeline', ['post_id'], unique=False)
+    op.create_index('ix_timeline_user_id_created_at_post_id', 'timeline', ['user_id', 'created_at', 'post_id'], unique=False)
+    op.add_column('users', sa.Column('followers_count', sa.Integer(), server_default='0', nullable=False))
+    # Existing posts show up in their authors' own timelines
+    op.execute(
+        'INSERT INTO timeline (user_id, post_id, author_id, created_at) '
+        'SELECT author_id, id, author_id, created_at FROM posts '
+        'WHERE author_id IS NOT NULL AND created_at IS NOT NULL'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('followers_count')
+    op.drop_index('ix_timeline_user_id_created_at_post_id', table_name='timeline')
+    op.drop_index('ix_timeline_post_id', table_name='timeline')
+    op.drop_table('timeline')
+    op.drop_index('ix_follows_followee_id_follower_id', table_name='follows')
+    op.drop_table('follows')
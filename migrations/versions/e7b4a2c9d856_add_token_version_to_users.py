@@ -0,0 +1,29 @@
+"""add token_version to users
+
+Revision ID: e7b4a2c9d856
+Revises: 5d9e0b3c7f21
+Create Date: 2026-10-18 13:41:52.660218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b4a2c9d856'
+down_revision: Union[str, None] = '5d9e0b3c7f21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('token_version')
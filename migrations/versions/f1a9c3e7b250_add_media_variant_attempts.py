@@ -0,0 +1,31 @@
+"""add media variant attempts
+
+Revision ID: f1a9c3e7b250
+Revises: d3f8a2b61c47
+Create Date: 2026-10-18 23:41:17.302815
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1a9c3e7b250'
+down_revision: Union[str, None] = 'd3f8a2b61c47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('media_blobs', sa.Column('variants_attempts', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('media_blobs', sa.Column('variants_attempted_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('media_blobs') as batch_op:
+        batch_op.drop_column('variants_attempted_at')
+        batch_op.drop_column('variants_attempts')
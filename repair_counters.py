@@ -0,0 +1,62 @@
+from sqlalchemy import func
+from app.database import SessionLocal
+from app.models import Post, Comment, likes
+
+
+def repair_post_counters(db, batch_size: int = 500) -> int:
+    """Recompute drifted likes_count/comments_count values, one id range at a time.
+
+    Each batch is committed on its own so a large table never holds the write
+    lock for long. Returns the number of posts that were corrected.
+    """
+    repaired = 0
+    last_id = 0
+    while True:
+        posts = (
+            db.query(Post.id, Post.likes_count, Post.comments_count)
+            .filter(Post.id > last_id)
+            .order_by(Post.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not posts:
+            return repaired
+        first_id, last_id = posts[0].id, posts[-1].id
+
+        likes_counts = dict(
+            db.query(likes.c.post_id, func.count())
+            .filter(likes.c.post_id.between(first_id, last_id))
+            .group_by(likes.c.post_id)
+            .all()
+        )
+        comments_counts = dict(
+            db.query(Comment.post_id, func.count(Comment.id))
+            .filter(Comment.post_id.between(first_id, last_id))
+            .group_by(Comment.post_id)
+            .all()
+        )
+
+        for post in posts:
+            actual = (
+                likes_counts.get(post.id, 0),
+                comments_counts.get(post.id, 0),
+            )
+            if (post.likes_count, post.comments_count) != actual:
+                db.query(Post).filter(Post.id == post.id).update(
+                    {
+                        Post.likes_count: actual[0],
+                        Post.comments_count: actual[1],
+                        Post.updated_at: Post.updated_at,
+                    },
+                    synchronize_session=False,
+                )
+                repaired += 1
+        db.commit()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    db = SessionLocal()
+    try:
+        print(f"Repaired counters on {repair_post_counters(db)} posts")
+    finally:
+        db.close()
@@ -1,6 +1,6 @@
 from app.database import SessionLocal, engine
 from app.models import User, Base
-from app.auth import get_password_hash
+from app.auth import get_password_hash, password_pool
 
 # Create tables if they don't exist
 Base.metadata.create_all(bind=engine)
@@ -9,11 +9,15 @@ Base.metadata.create_all(bind=engine)
 def seed_database():
     db = SessionLocal()
 
+    # Hash both passwords concurrently on the bounded bcrypt pool
+    user_hash = password_pool.submit(get_password_hash, "user")
+    admin_hash = password_pool.submit(get_password_hash, "admin")
+
     # Create regular user
     user = User(
         user_name="user",
         email="user@example.com",
-        password_hash=get_password_hash("user"),
+        password_hash=user_hash.result(),
         is_admin=False,
     )
 
@@ -21,7 +25,7 @@ def seed_database():
     admin = User(
         user_name="admin",
         email="admin@example.com",
-        password_hash=get_password_hash("admin"),
+        password_hash=admin_hash.result(),
         is_admin=True,
     )
 
@@ -1,15 +1,25 @@
+import os
+import shutil
+import tempfile
 import pytest
+import pytest_asyncio
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool, StaticPool
 
-from app.database import Base, get_db
+from app.database import Base, get_async_db, get_db, get_read_db, recent_writers
 from app.main import app
 from app.models import User, Post, Comment
-from app.auth import get_password_hash
+from app.auth import get_password_hash, token_versions, user_cache
+from app.response_cache import response_cache
 
-SQLALCHEMY_DATABASE_URL = "sqlite://"
+# The sync and async engines must see the same data, so tests use a file
+# database instead of a private in-memory one.
+TEST_DB_DIR = tempfile.mkdtemp()
+TEST_DB_PATH = os.path.join(TEST_DB_DIR, "test.db")
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{TEST_DB_PATH}"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
@@ -18,6 +28,56 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# NullPool: every TestClient runs its own event loop, and aiosqlite
+# connections must not outlive the loop that opened them.
+async_engine = create_async_engine(
+    f"sqlite+aiosqlite:///{TEST_DB_PATH}", poolclass=NullPool
+)
+TestingAsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
+@pytest.fixture(scope="session", autouse=True)
+def test_db_dir():
+    yield TEST_DB_DIR
+    shutil.rmtree(TEST_DB_DIR, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def clear_user_cache():
+    user_cache.clear()
+    token_versions.clear()
+    response_cache.clear()
+    recent_writers.clear()
+    yield
+    user_cache.clear()
+    token_versions.clear()
+    response_cache.clear()
+    recent_writers.clear()
+
+
+@pytest.fixture(autouse=True)
+def background_sessions(monkeypatch):
+    """Work that outlives a request opens its own sessions; point those at
+    the test database too."""
+    monkeypatch.setattr(
+        "app.image_variants.AsyncSessionLocal", TestingAsyncSessionLocal
+    )
+    monkeypatch.setattr("app.main.ReadSessionLocal", TestingSessionLocal)
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    """Store uploads under a temporary directory instead of the repo's."""
+    monkeypatch.setattr("app.config.settings.upload_dir", str(tmp_path))
+    return str(tmp_path)
+
 
 @pytest.fixture(scope="function")
 def db():
@@ -30,6 +90,12 @@ def db():
         Base.metadata.drop_all(bind=engine)
 
 
+@pytest_asyncio.fixture
+async def async_db(db):
+    async with TestingAsyncSessionLocal() as session:
+        yield session
+
+
 @pytest.fixture(scope="function")
 def client(db):
     def override_get_db():
@@ -39,6 +105,8 @@ def client(db):
             db.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
@@ -89,6 +157,8 @@ def other_authorized_client(db):
             db.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
     with TestClient(app) as test_client:
         # Create another user
         other_user = User(
@@ -113,3 +183,23 @@ def other_authorized_client(db):
         }
         yield test_client
     app.dependency_overrides.clear()
+
+
+@pytest.fixture(scope="function")
+def query_plans():
+    """Collect ``EXPLAIN QUERY PLAN`` output for every statement the app runs."""
+    plans = []
+
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper()
+        if executemany or verb not in ("SELECT", "UPDATE", "DELETE"):
+            return
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        plans.append((statement, [row[3] for row in cursor.fetchall()]))
+
+    engines = (engine, async_engine.sync_engine)
+    for target in engines:
+        event.listen(target, "before_cursor_execute", explain)
+    yield plans
+    for target in engines:
+        event.remove(target, "before_cursor_execute", explain)
@@ -1,5 +1,11 @@
+import json
+import threading
+from unittest.mock import patch
 import pytest
-from fastapi import status
+from fastapi import HTTPException, status
+from app.auth import EVICT_TOPIC, token_user_id, token_versions, user_cache
+from app.models import User
+from app.websocket_manager import manager
 
 
 def test_create_user(client):
@@ -117,3 +123,214 @@ def test_get_current_user_nonexistent_user(authorized_client):
         "/users/me/", headers={"Authorization": f"Bearer {token}"}
     )
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_get_current_user_is_cached(authorized_client):
+    assert authorized_client.get("/users/me/").status_code == status.HTTP_200_OK
+
+    # Both the user and their token version now come from memory
+    with patch(
+        "sqlalchemy.ext.asyncio.AsyncSession.execute",
+        side_effect=AssertionError("queried"),
+    ):
+        response = authorized_client.get("/users/me/")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["user_name"] == "testuser"
+
+
+def test_deleted_user_is_evicted_on_commit(authorized_client, db, test_user):
+    user_id = test_user.id
+    authorized_client.get("/users/me/")
+
+    user = db.get(User, user_id)
+    user.email = "rolled-back@example.com"
+    db.flush()
+    # Nothing is evicted until the change commits
+    assert user_cache.get("testuser") is not None
+    db.rollback()
+    assert user_cache.get("testuser") is not None
+
+    db.delete(db.get(User, user_id))
+    db.commit()
+    assert user_cache.get("testuser") is None
+    response = authorized_client.get("/users/me/")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_cached_user_invalidated_on_update(authorized_client, db, test_user):
+    user_id = test_user.id
+    authorized_client.get("/users/me/")
+
+    user = db.get(User, user_id)
+    user.email = "changed@example.com"
+    db.commit()
+
+    response = authorized_client.get("/users/me/")
+    assert response.json()["email"] == "changed@example.com"
+
+
+def test_password_pool_rejects_when_backlog_full():
+    from app.auth import PasswordHashPool
+
+    pool = PasswordHashPool(max_workers=1, max_pending=1)
+    release = threading.Event()
+    try:
+        running = pool.submit(release.wait)
+        with pytest.raises(HTTPException) as exc_info:
+            pool.submit(release.wait)
+        assert exc_info.value.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    finally:
+        release.set()
+    assert running.result() is True
+    assert pool.submit(lambda: "ok").result() == "ok"
+    pool.shutdown()
+
+
+def test_login_fast_fails_when_password_pool_busy(client, test_user):
+    with patch("app.auth.password_pool.max_pending", 0):
+        response = client.post(
+            "/token", data={"username": "testuser", "password": "testpass123"}
+        )
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_metrics_report_password_pool_wait(authorized_client, db, test_user):
+    response = authorized_client.get("/api/metrics")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    test_user.is_admin = True
+    db.commit()
+    token = authorized_client.post(
+        "/token", data={"username": "testuser", "password": "testpass123"}
+    ).json()["access_token"]
+    response = authorized_client.get(
+        "/api/metrics", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    wait = response.json()["timings"]["password_pool.wait_seconds"]
+    assert wait["count"] >= 1
+    assert wait["avg"] >= 0
+
+
+def test_login_returns_self_contained_tokens(client, test_user):
+    from app.auth import decode_token, REFRESH_TOKEN_TYPE
+
+    data = client.post(
+        "/token", data={"username": "testuser", "password": "testpass123"}
+    ).json()
+    claims = decode_token(data["access_token"])
+    assert claims["sub"] == "testuser"
+    assert claims["uid"] == test_user.id
+    assert claims["adm"] is False
+    assert claims["ver"] == 0
+    assert (
+        decode_token(data["refresh_token"], REFRESH_TOKEN_TYPE)["uid"] == claims["uid"]
+    )
+
+
+def test_refresh_token(client, test_user):
+    refresh_token = client.post(
+        "/token", data={"username": "testuser", "password": "testpass123"}
+    ).json()["refresh_token"]
+
+    response = client.post("/token/refresh", json={"refresh_token": refresh_token})
+    assert response.status_code == status.HTTP_200_OK
+    access_token = response.json()["access_token"]
+    response = client.get(
+        "/users/me/", headers={"Authorization": f"Bearer {access_token}"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_token_user_id(test_user, test_user_token):
+    assert token_user_id(f"Bearer {test_user_token}") == test_user.id
+    assert token_user_id(test_user_token) is None
+    assert token_user_id("Bearer forged") is None
+    assert token_user_id(None) is None
+
+
+def test_refresh_token_is_not_an_access_token(client, test_user):
+    refresh_token = client.post(
+        "/token", data={"username": "testuser", "password": "testpass123"}
+    ).json()["refresh_token"]
+    response = client.get(
+        "/users/me/", headers={"Authorization": f"Bearer {refresh_token}"}
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_access_token_is_not_a_refresh_token(authorized_client, test_user_token):
+    response = authorized_client.post(
+        "/token/refresh", json={"refresh_token": test_user_token}
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_revoke_tokens(client, test_user):
+    tokens = client.post(
+        "/token", data={"username": "testuser", "password": "testpass123"}
+    ).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    response = client.post("/token/revoke", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    assert client.get("/users/me/", headers=headers).status_code == 401
+    assert (
+        client.post("/posts/", json={"content": "x"}, headers=headers).status_code
+        == 401
+    )
+    response = client.post(
+        "/token/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_token_claims_authorize_without_user_lookup(authorized_client, test_post):
+    post_id = test_post.id
+    assert authorized_client.put(f"/posts/{post_id}/like").status_code == 200
+
+    # With the token version cached, authorization never queries
+    with patch(
+        "sqlalchemy.ext.asyncio.AsyncSession.execute",
+        side_effect=AssertionError("queried"),
+    ):
+        response = authorized_client.delete(f"/posts/{post_id}/like")
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_token_without_version_is_rejected(authorized_client, test_post):
+    from app.auth import create_access_token
+
+    # It could never be revoked
+    token = create_access_token({"sub": "testuser"})
+    headers = {"Authorization": f"Bearer {token}"}
+    response = authorized_client.put(f"/posts/{test_post.id}/like", headers=headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    response = authorized_client.get("/users/me/", headers=headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_revoke_for_missing_user(authorized_client, db):
+    authorized_client.get("/users/me/")
+    # A bulk delete skips the ORM, so the cached token version survives
+    db.query(User).delete()
+    db.commit()
+    response = authorized_client.post("/token/revoke")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_user_changes_are_relayed_to_other_workers(authorized_client, db, test_user):
+    user_id = test_user.id
+    authorized_client.get("/users/me/")
+    with patch("app.auth.event_bus.relay") as relay:
+        user = db.get(User, user_id)
+        user.token_version += 1
+        db.commit()
+    relay.assert_called_once_with(EVICT_TOPIC, json.dumps([["testuser"], user_id]))
+
+    # What another worker does when the relayed message arrives
+    token_versions.set(user_id, 0)
+    manager.deliver(EVICT_TOPIC, json.dumps([["testuser"], user_id]))
+    assert token_versions.get(user_id) is None
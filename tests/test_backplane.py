@@ -0,0 +1,110 @@
+import asyncio
+import os
+import socket
+import pytest
+import pytest_asyncio
+from fastapi import WebSocket
+from unittest.mock import AsyncMock
+from app.backplane import LocalBackplane, UnixSocketBackplane
+from app.metrics import metrics
+from app.websocket_manager import ConnectionManager
+
+
+@pytest_asyncio.fixture
+async def backplanes(tmp_path):
+    started = []
+
+    async def make(deliver=lambda topic, message: None):
+        backplane = UnixSocketBackplane(str(tmp_path), peer_refresh_seconds=0)
+        await backplane.start(deliver)
+        started.append(backplane)
+        return backplane
+
+    yield make
+    for backplane in started:
+        await backplane.stop()
+
+
+async def _settle():
+    for _ in range(10):
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_publish_reaches_other_workers_in_order(backplanes):
+    received, own = [], []
+    sender = await backplanes(lambda topic, message: own.append(message))
+    await backplanes(lambda topic, message: received.append((topic, message)))
+
+    for i in range(5):
+        sender.publish("post:1", f"m{i}")
+    await _settle()
+
+    assert received == [("post:1", f"m{i}") for i in range(5)]
+    assert own == []
+
+
+@pytest.mark.asyncio
+async def test_duplicates_and_stale_messages_are_dropped(backplanes):
+    received = []
+    receiver = await backplanes(lambda topic, message: received.append(message))
+
+    receiver.handle("worker-a", 1, "post:1", "first")
+    receiver.handle("worker-a", 1, "post:1", "first")
+    receiver.handle("worker-a", 3, "post:1", "third")
+    receiver.handle("worker-a", 2, "post:1", "second, too late")
+    # Sequences are per sender and per topic
+    receiver.handle("worker-b", 1, "post:1", "other sender")
+    receiver.handle("worker-a", 1, "post:2", "other topic")
+
+    assert received == ["first", "third", "other sender", "other topic"]
+
+
+@pytest.mark.asyncio
+async def test_dead_peer_socket_is_removed(backplanes, tmp_path):
+    stale = os.path.join(str(tmp_path), "gone.sock")
+    dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    dead.bind(stale)
+    dead.close()
+
+    sender = await backplanes()
+    sender.publish("feed", "hello")
+    assert not os.path.exists(stale)
+
+
+@pytest.mark.asyncio
+async def test_stop_removes_socket(tmp_path):
+    backplane = UnixSocketBackplane(str(tmp_path))
+    await backplane.start(lambda topic, message: None)
+    assert os.path.exists(backplane.path)
+    await backplane.stop()
+    assert not os.path.exists(backplane.path)
+
+
+@pytest.mark.asyncio
+async def test_managers_share_publishes(tmp_path):
+    metrics.reset()
+    first = ConnectionManager(backplane=UnixSocketBackplane(str(tmp_path), 0))
+    second = ConnectionManager(backplane=UnixSocketBackplane(str(tmp_path), 0))
+    await first.start()
+    await second.start()
+    try:
+        websocket = AsyncMock(spec=WebSocket)
+        await second.connect(websocket, 2)
+        second.subscribe(websocket, "post:9")
+
+        assert first.publish("post:9", "new comment") == 0
+        await _settle()
+        await second.drain()
+        websocket.send_text.assert_awaited_once_with("new comment")
+        assert metrics.snapshot()["counters"]["backplane.received"] == 1
+    finally:
+        await second.disconnect(websocket, 2)
+        await first.stop()
+        await second.stop()
+
+
+@pytest.mark.asyncio
+async def test_local_backplane_is_default():
+    manager = ConnectionManager()
+    assert isinstance(manager.backplane, LocalBackplane)
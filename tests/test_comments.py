@@ -146,3 +146,33 @@ def test_delete_comment_unauthorized(
     response = other_authorized_client.delete(f"/comments/{comment['id']}")
     assert response.status_code == status.HTTP_403_FORBIDDEN
     assert response.json()["detail"] == "Not authorized to delete this comment"
+
+
+def test_get_comments_cursor_pagination(authorized_client, test_post):
+    post_id = test_post.id
+    for i in range(3):
+        authorized_client.post(
+            f"/posts/{post_id}/comments/", json={"content": f"Comment {i}"}
+        )
+
+    first = authorized_client.get(f"/posts/{post_id}/comments/", params={"limit": 2})
+    assert [c["content"] for c in first.json()] == ["Comment 0", "Comment 1"]
+
+    second = authorized_client.get(
+        f"/posts/{post_id}/comments/",
+        params={"limit": 2, "cursor": first.headers["X-Next-Cursor"]},
+    )
+    assert [c["content"] for c in second.json()] == ["Comment 2"]
+    assert "X-Next-Cursor" not in second.headers
+
+
+def test_comment_counter_follows_writes(authorized_client):
+    post = authorized_client.post("/posts/", json={"content": "Counted"}).json()
+    comment = authorized_client.post(
+        f"/posts/{post['id']}/comments/", json={"content": "First"}
+    ).json()
+    authorized_client.post(f"/posts/{post['id']}/comments/", json={"content": "Second"})
+    assert authorized_client.get(f"/posts/{post['id']}").json()["comments_count"] == 2
+
+    authorized_client.delete(f"/comments/{comment['id']}")
+    assert authorized_client.get(f"/posts/{post['id']}").json()["comments_count"] == 1
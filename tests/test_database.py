@@ -1,7 +1,26 @@
+from types import SimpleNamespace
 import pytest
-from sqlalchemy.exc import SQLAlchemyError
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database import get_db, SessionLocal
+from app import models
+from app.config import settings
+from app.database import (
+    _read_replica_url,
+    create_async_db_engine,
+    create_db_engine,
+    engine,
+    get_async_db,
+    get_db,
+    get_read_db,
+    is_recent_writer,
+    mark_recent_write,
+    read_engine,
+    SessionLocal,
+    upsert_insert,
+)
 
 
 def test_get_db_session():
@@ -39,3 +58,103 @@ def test_get_db_session_error_handling():
     # Verify session is closed
     with pytest.raises(SQLAlchemyError):
         db.execute("SELECT 1")
+
+
+@pytest.mark.asyncio
+async def test_get_async_db_session():
+    db_gen = get_async_db()
+    db = await db_gen.__anext__()
+    assert isinstance(db, AsyncSession)
+    assert (await db.execute(text("SELECT 1"))).scalar() == 1
+
+    with pytest.raises(StopAsyncIteration):
+        await db_gen.__anext__()
+
+
+def test_production_profile_applies_sqlite_pragmas(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'prod.db'}", "production")
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == (
+            settings.sqlite_busy_timeout_ms
+        )
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+    assert engine.pool.size() == settings.db_pool_size
+    engine.dispose()
+
+
+def test_default_profile_leaves_sqlite_defaults(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'plain.db'}", "default")
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "delete"
+    engine.dispose()
+
+
+def test_in_memory_database_engine():
+    engine = create_db_engine("sqlite://")
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+
+
+@pytest.mark.asyncio
+async def test_async_engine_applies_sqlite_pragmas(tmp_path):
+    engine = create_async_db_engine(f"sqlite:///{tmp_path / 'async.db'}", "production")
+    async with engine.connect() as conn:
+        assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+    await engine.dispose()
+
+
+def _request(user_id=None):
+    request = Request({"type": "http", "headers": []})
+    request.state.user_id = user_id
+    return request
+
+
+def test_get_read_db_uses_read_replica():
+    db_gen = get_read_db(_request(user_id=1))
+    db = next(db_gen)
+    assert db.get_bind() is read_engine
+    db_gen.close()
+
+
+def test_get_read_db_sticks_to_primary_after_write():
+    mark_recent_write(_request(user_id=2))
+    # Any request from the same user, whatever token it carries
+    db_gen = get_read_db(_request(user_id=2))
+    db = next(db_gen)
+    assert db.get_bind() is engine
+    db_gen.close()
+    assert not is_recent_writer(_request())
+
+
+def test_read_replica_url_for_sqlite_file():
+    assert _read_replica_url("sqlite:////tmp/app.db") == (
+        "sqlite:///file:/tmp/app.db?mode=ro&uri=true"
+    )
+    assert _read_replica_url("sqlite://") is None
+
+
+def test_read_only_engine_rejects_writes(tmp_path):
+    path = tmp_path / "replica.db"
+    primary = create_db_engine(f"sqlite:///{path}")
+    with primary.begin() as conn:
+        conn.execute(text("CREATE TABLE t (x INTEGER)"))
+    replica = create_db_engine(_read_replica_url(f"sqlite:///{path}"), read_only=True)
+    with replica.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM t")).scalar() == 0
+        with pytest.raises(OperationalError):
+            conn.execute(text("INSERT INTO t VALUES (1)"))
+    replica.dispose()
+    primary.dispose()
+
+
+def test_upsert_insert_follows_session_dialect(db):
+    statement = upsert_insert(db, models.MediaVariant).values(
+        sha256="a" * 64, width=160, height=90, size=1
+    )
+    sql = str(statement.on_conflict_do_nothing().compile(db.bind))
+    assert "ON CONFLICT DO NOTHING" in sql
+
+    mysql = SimpleNamespace(bind=SimpleNamespace(dialect=SimpleNamespace(name="mysql")))
+    with pytest.raises(NotImplementedError):
+        upsert_insert(mysql, models.MediaVariant)
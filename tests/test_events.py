@@ -0,0 +1,96 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import MagicMock
+from sqlalchemy import text
+from app.events import EventBus, emit, event_bus
+
+
+def _subscribe(websocket, topic):
+    websocket.send_text(json.dumps({"action": "subscribe", "topic": topic}))
+    assert websocket.receive_json() == {"type": "subscribed", "topic": topic}
+
+
+def test_post_and_comment_events(
+    authorized_client, other_authorized_client, test_user_token, test_post
+):
+    post_id = test_post.id
+    with authorized_client, authorized_client.websocket_connect(
+        f"/ws?token={test_user_token}"
+    ) as websocket:
+        _subscribe(websocket, "feed")
+        response = authorized_client.post("/posts/", json={"content": "Live post"})
+        message = websocket.receive_json()
+        assert message["event"] == "post_created"
+        assert message["topic"] == "feed"
+        assert message["data"]["id"] == response.json()["id"]
+
+        _subscribe(websocket, f"post:{post_id}")
+        other_authorized_client.post(
+            f"/posts/{post_id}/comments/", json={"content": "Nice"}
+        )
+        events = {m["event"]: m for m in (websocket.receive_json() for _ in range(2))}
+        # Once on the post's topic, once as a notification to the post author
+        assert events["comment_created"]["topic"] == f"post:{post_id}"
+        assert events["comment_created"]["data"]["comments_count"] == 1
+        assert events["comment_on_your_post"]["topic"].startswith("user:")
+
+
+def test_like_events_are_coalesced(
+    authorized_client, other_authorized_client, test_user_token, test_post, monkeypatch
+):
+    post_id = test_post.id
+    monkeypatch.setattr(event_bus, "like_interval", 3600)
+    with authorized_client, authorized_client.websocket_connect(
+        f"/ws?token={test_user_token}"
+    ) as websocket:
+        _subscribe(websocket, f"post:{post_id}")
+        authorized_client.put(f"/posts/{post_id}/like")
+        other_authorized_client.put(f"/posts/{post_id}/like")
+        authorized_client.delete(f"/posts/{post_id}/like")
+        # Flush on the app's loop instead of waiting for the interval
+        authorized_client.portal.call(event_bus.flush_likes)
+
+        message = websocket.receive_json()
+        assert message["event"] == "likes_updated"
+        assert message["data"] == {"post_id": post_id, "likes_count": 1}
+
+
+@pytest.mark.asyncio
+async def test_flush_sends_latest_count_once():
+    connections = MagicMock()
+    bus = EventBus(connections, like_interval=3600)
+    await bus.start()
+    try:
+        for count in range(1, 51):
+            bus.likes_changed(7, count)
+        bus.likes_changed(8, 3)
+        await asyncio.sleep(0)
+        bus.flush_likes()
+    finally:
+        await bus.stop()
+
+    published = [
+        json.loads(call.args[1]) for call in connections.publish.call_args_list
+    ]
+    assert [(m["topic"], m["data"]["likes_count"]) for m in published] == [
+        ("post:7", 50),
+        ("post:8", 3),
+    ]
+
+
+def test_events_wait_for_commit(db, monkeypatch):
+    published = MagicMock()
+    monkeypatch.setattr(event_bus, "publish", published)
+
+    db.execute(text("SELECT 1"))
+    emit(db, "feed", "post_created", {"id": 1})
+    db.rollback()
+    db.commit()
+    published.assert_not_called()
+
+    db.execute(text("SELECT 1"))
+    emit(db, "feed", "post_created", {"id": 2})
+    published.assert_not_called()
+    db.commit()
+    published.assert_called_once_with("feed", "post_created", {"id": 2})
@@ -1,9 +1,24 @@
+import io
 import os
 import pytest
-from fastapi import UploadFile
-from app.file_handler import save_upload_file, get_file_extension, is_valid_file_type
+import hashlib
+from unittest.mock import patch
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import event
+from app import models
+from app.file_handler import (
+    UploadSizeLimitMiddleware,
+    blob_path,
+    delete_media_file,
+    detect_file_type,
+    save_upload_file,
+    get_file_extension,
+    is_valid_file_type,
+)
 from app.config import settings
 
+JPEG_HEADER = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01"
+
 
 @pytest.fixture
 def test_upload_file():
@@ -23,12 +38,93 @@ def test_upload_dir():
 
 
 @pytest.mark.asyncio
-async def test_save_upload_file(test_upload_file, test_upload_dir):
-    user_id = 1
-    file_path = await save_upload_file(test_upload_file, user_id)
-    assert os.path.exists(file_path)
-    assert str(user_id) in file_path
-    assert test_upload_file.filename in file_path
+async def test_save_upload_file(test_upload_file, test_upload_dir, async_db):
+    stored = await save_upload_file(test_upload_file, 1, async_db)
+    with open("tests/test_files/test.jpg", "rb") as original:
+        sha256 = hashlib.sha256(original.read()).hexdigest()
+    assert stored.sha256 == sha256
+    assert stored.filename == test_upload_file.filename
+    assert stored.location == blob_path(sha256, ".jpg")
+    assert stored.location.endswith(
+        os.path.join(sha256[:2], sha256[2:4], sha256 + ".jpg")
+    )
+    assert os.path.exists(stored.location)
+
+
+@pytest.mark.asyncio
+async def test_identical_uploads_share_one_blob(test_upload_dir, async_db):
+    content = JPEG_HEADER + b"same bytes"
+    first = await save_upload_file(
+        UploadFile(filename="a.jpg", file=io.BytesIO(content)), 1, async_db
+    )
+    second = await save_upload_file(
+        UploadFile(filename="b.jpg", file=io.BytesIO(content)), 2, async_db
+    )
+    assert first.location == second.location
+    assert first.id != second.id
+    blob = await async_db.get(models.MediaBlob, first.sha256, populate_existing=True)
+    assert blob.ref_count == 2
+    assert os.listdir(os.path.dirname(first.location)) == [
+        os.path.basename(first.location)
+    ]
+
+    await delete_media_file(async_db, await async_db.get(models.MediaFile, first.id))
+    assert os.path.exists(second.location)
+    blob = await async_db.get(models.MediaBlob, first.sha256, populate_existing=True)
+    assert blob.ref_count == 1
+
+    await delete_media_file(async_db, await async_db.get(models.MediaFile, second.id))
+    assert not os.path.exists(second.location)
+    assert await async_db.get(models.MediaBlob, first.sha256) is None
+
+
+@pytest.mark.asyncio
+async def test_delete_last_reference_with_foreign_keys(upload_dir, async_db, test_user):
+    def enforce_foreign_keys(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    engine = async_db.bind.sync_engine
+    event.listen(engine, "connect", enforce_foreign_keys)
+    try:
+        stored = await save_upload_file(
+            UploadFile(filename="a.jpg", file=io.BytesIO(JPEG_HEADER + b"fk")),
+            test_user.id,
+            async_db,
+        )
+        media_file = await async_db.get(models.MediaFile, stored.id)
+        await delete_media_file(async_db, media_file)
+    finally:
+        event.remove(engine, "connect", enforce_foreign_keys)
+    assert not os.path.exists(stored.location)
+    assert await async_db.get(models.MediaBlob, stored.sha256) is None
+
+
+@pytest.mark.asyncio
+async def test_failed_delete_keeps_blob_file(upload_dir, async_db):
+    stored = await save_upload_file(
+        UploadFile(filename="a.jpg", file=io.BytesIO(JPEG_HEADER + b"kept")),
+        1,
+        async_db,
+    )
+    media_file = await async_db.get(models.MediaFile, stored.id)
+    with patch.object(async_db, "commit", side_effect=OSError("disk full")):
+        with pytest.raises(OSError):
+            await delete_media_file(async_db, media_file)
+    await async_db.rollback()
+    assert os.path.exists(stored.location)
+
+
+@pytest.mark.asyncio
+async def test_failed_commit_leaves_no_blob_file(upload_dir, async_db):
+    content = JPEG_HEADER + b"never committed"
+    sha256 = hashlib.sha256(content).hexdigest()
+    upload = UploadFile(filename="a.jpg", file=io.BytesIO(content))
+    with patch.object(async_db, "commit", side_effect=OSError("disk full")):
+        with pytest.raises(OSError):
+            await save_upload_file(upload, 1, async_db)
+    assert not os.path.exists(blob_path(sha256, ".jpg"))
+    assert os.listdir(os.path.join(upload_dir, "tmp")) == []
+    assert await async_db.get(models.MediaBlob, sha256) is None
 
 
 def test_get_file_extension():
@@ -45,3 +141,111 @@ def test_is_valid_file_type():
     assert is_valid_file_type("test.webm")
     assert not is_valid_file_type("test.txt")
     assert not is_valid_file_type("test.pdf")
+
+
+@pytest.mark.asyncio
+async def test_save_upload_file_too_large(test_upload_dir, async_db, monkeypatch):
+    monkeypatch.setattr(settings, "max_upload_size", 1024)
+    upload = UploadFile(filename="big.jpg", file=io.BytesIO(JPEG_HEADER + b"0" * 2048))
+    with pytest.raises(HTTPException) as exc_info:
+        await save_upload_file(upload, 1, async_db)
+    assert exc_info.value.status_code == 413
+    assert os.listdir(os.path.join(test_upload_dir, "tmp")) == []
+
+
+@pytest.mark.asyncio
+async def test_save_upload_file_checks_content(test_upload_dir, async_db):
+    upload = UploadFile(filename="fake.jpg", file=io.BytesIO(b"not really an image"))
+    with pytest.raises(HTTPException) as exc_info:
+        await save_upload_file(upload, 1, async_db)
+    assert exc_info.value.status_code == 400
+    assert os.listdir(os.path.join(test_upload_dir, "tmp")) == []
+
+
+@pytest.mark.asyncio
+async def test_save_upload_file_streams_in_chunks(
+    test_upload_dir, async_db, monkeypatch
+):
+    monkeypatch.setattr("app.file_handler.CHUNK_SIZE", 4)
+    content = JPEG_HEADER + b"x" * 100
+    upload = UploadFile(filename="chunks.jpg", file=io.BytesIO(content))
+    stored = await save_upload_file(upload, 1, async_db)
+    assert stored.sha256 == hashlib.sha256(content).hexdigest()
+    with open(stored.location, "rb") as saved:
+        assert saved.read() == content
+
+
+def test_detect_file_type():
+    assert detect_file_type(JPEG_HEADER) == ".jpg"
+    assert detect_file_type(b"\x89PNG\r\n\x1a\n" + b"\0" * 8) == ".png"
+    assert detect_file_type(b"GIF89a" + b"\0" * 10) == ".gif"
+    assert detect_file_type(b"RIFF\0\0\0\0WEBPVP8 ") == ".webp"
+    assert detect_file_type(b"\0\0\0\x18ftypmp42\0\0\0\0") == ".mp4"
+    assert detect_file_type(b"\0\0\0\x18ftypisom\0\0\0\0") == ".mp4"
+    for brand in (b"heic", b"avif", b"qt  "):
+        assert detect_file_type(b"\0\0\0\x18ftyp" + brand + b"\0\0\0\0") is None
+    assert detect_file_type(b"\x1a\x45\xdf\xa3" + b"\0" * 12) == ".webm"
+    assert detect_file_type(b"%PDF-1.7\n") is None
+
+
+async def _echo_app(scope, receive, send):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _call(middleware, chunks, headers=()):
+    messages = iter(
+        [
+            {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+            for i, chunk in enumerate(chunks)
+        ]
+    )
+    sent = []
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "path": "/api/upload", "headers": list(headers)}
+    await middleware(scope, receive, send)
+    return sent
+
+
+@pytest.mark.asyncio
+async def test_upload_size_limit_rejects_declared_length():
+    middleware = UploadSizeLimitMiddleware(_echo_app, max_body_size=10)
+    sent = await _call(middleware, [b"x" * 20], [(b"content-length", b"20")])
+    assert sent[0]["status"] == 413
+
+
+@pytest.mark.asyncio
+async def test_upload_size_limit_rejects_malformed_length():
+    middleware = UploadSizeLimitMiddleware(_echo_app, max_body_size=10)
+    for length in (b"abc", b"-1"):
+        sent = await _call(middleware, [b"x"], [(b"content-length", length)])
+        assert sent[0]["status"] == 400
+
+
+@pytest.mark.asyncio
+async def test_upload_size_limit_aborts_streamed_body():
+    middleware = UploadSizeLimitMiddleware(_echo_app, max_body_size=10)
+    sent = await _call(middleware, [b"x" * 6, b"x" * 6, b"x" * 6])
+    assert [m["status"] for m in sent if "status" in m] == [413]
+
+
+@pytest.mark.asyncio
+async def test_upload_size_limit_passes_small_body():
+    middleware = UploadSizeLimitMiddleware(_echo_app, max_body_size=10)
+    sent = await _call(middleware, [b"x" * 4, b"x" * 4])
+    assert sent[0]["status"] == 200
+    assert sent[1]["body"] == b"x" * 8
@@ -0,0 +1,145 @@
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+import pytest
+from PIL import Image
+from app.config import settings
+from app.image_variants import pick_variant, render_variants
+
+pytestmark = pytest.mark.usefixtures("upload_dir")
+
+
+@pytest.fixture
+def upload_image(tmp_path):
+    def make(width, height, name="source.jpg"):
+        path = tmp_path / name
+        Image.new("RGB", (width, height), (200, 40, 40)).save(path)
+        return str(path)
+
+    return make
+
+
+def test_render_variants_skips_upscaling(upload_image):
+    source = upload_image(800, 600)
+    rendered = render_variants(source, [160, 320, 640, 1280], 80)
+    assert [(width, height) for width, height, _ in rendered] == [
+        (160, 120),
+        (320, 240),
+        (640, 480),
+    ]
+    for width, height, size in rendered:
+        path = f"{os.path.splitext(source)[0]}_{width}.webp"
+        assert os.path.getsize(path) == size
+        with Image.open(path) as variant:
+            assert variant.format == "WEBP"
+            assert variant.size == (width, height)
+
+
+def test_render_variants_small_image_keeps_its_size(upload_image):
+    source = upload_image(100, 50, name="small.png")
+    rendered = render_variants(source, [160, 320], 80)
+    assert [(width, height) for width, height, _ in rendered] == [(100, 50)]
+
+
+def test_pick_variant():
+    variants = [SimpleNamespace(width=w) for w in (640, 160, 320)]
+    assert pick_variant(variants, 100).width == 160
+    assert pick_variant(variants, 200).width == 320
+    assert pick_variant(variants, 2000).width == 640
+    assert pick_variant([], 200) is None
+
+
+def test_upload_generates_variants(authorized_client):
+    with open("tests/test_files/test.jpg", "rb") as image:
+        response = authorized_client.post(
+            "/api/upload", files={"file": ("photo.jpg", image.read())}
+        )
+    assert response.status_code == 200
+    stored = response.json()
+    assert stored["variants_status"] == "pending"
+
+    response = authorized_client.get(f"/api/upload/{stored['id']}/variants")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "ready"
+    assert [variant["width"] for variant in data["variants"]] == [160, 320]
+    for variant in data["variants"]:
+        assert os.path.exists(variant["location"])
+
+    response = authorized_client.get(
+        f"/api/upload/{stored['id']}/variants", params={"width": 200}
+    )
+    assert [variant["width"] for variant in response.json()["variants"]] == [320]
+
+    response = authorized_client.get(
+        f"/api/upload/{stored['id']}/image", params={"width": 100}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+
+    locations = [variant["location"] for variant in data["variants"]]
+    authorized_client.delete(f"/api/upload/{stored['id']}")
+    assert not any(os.path.exists(location) for location in locations)
+    assert not os.path.exists(stored["location"])
+
+
+def test_variants_unknown_file(authorized_client):
+    response = authorized_client.get("/api/upload/999/variants")
+    assert response.status_code == 404
+
+
+def _upload_failing(authorized_client, failing):
+    with patch("app.image_variants.variant_pool.run", failing):
+        with open("tests/test_files/test.jpg", "rb") as image:
+            response = authorized_client.post(
+                "/api/upload", files={"file": ("photo.jpg", image.read())}
+            )
+    return response.json()["id"]
+
+
+def test_failed_variants_are_retried_on_lookup(authorized_client, monkeypatch):
+    monkeypatch.setattr(settings, "image_variant_retry_seconds", 0)
+    failing = AsyncMock(side_effect=OSError("worker died"))
+    with patch("app.image_variants.variant_pool.run", failing):
+        with open("tests/test_files/test.jpg", "rb") as image:
+            response = authorized_client.post(
+                "/api/upload", files={"file": ("photo.jpg", image.read())}
+            )
+        file_id = response.json()["id"]
+        response = authorized_client.get(f"/api/upload/{file_id}/variants")
+        assert response.json()["status"] == "failed"
+
+    # This lookup still sees the failure but schedules another attempt
+    authorized_client.get(f"/api/upload/{file_id}/variants")
+    response = authorized_client.get(f"/api/upload/{file_id}/variants")
+    assert response.json()["status"] == "ready"
+    authorized_client.delete(f"/api/upload/{file_id}")
+
+
+def test_failed_variants_back_off(authorized_client):
+    failing = AsyncMock(side_effect=OSError("not really a JPEG"))
+    file_id = _upload_failing(authorized_client, failing)
+    with patch("app.image_variants.variant_pool.run", failing):
+        for _ in range(3):
+            response = authorized_client.get(f"/api/upload/{file_id}/variants")
+            assert response.json()["status"] == "failed"
+            authorized_client.get(f"/api/upload/{file_id}/image")
+    assert failing.await_count == 1
+    authorized_client.delete(f"/api/upload/{file_id}")
+
+
+def test_failed_variants_stop_after_max_attempts(authorized_client, monkeypatch):
+    monkeypatch.setattr(settings, "image_variant_retry_seconds", 0)
+    monkeypatch.setattr(settings, "image_variant_max_attempts", 2)
+    failing = AsyncMock(side_effect=OSError("not really a JPEG"))
+    file_id = _upload_failing(authorized_client, failing)
+    with patch("app.image_variants.variant_pool.run", failing):
+        for _ in range(4):
+            authorized_client.get(f"/api/upload/{file_id}/variants")
+        response = authorized_client.get(
+            f"/api/upload/{file_id}/image", follow_redirects=False
+        )
+    assert failing.await_count == 2
+    # The original is served instead
+    assert response.headers["location"].endswith(".jpg")
+    authorized_client.delete(f"/api/upload/{file_id}")
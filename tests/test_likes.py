@@ -1,5 +1,8 @@
+import base64
+import json
 import pytest
 from fastapi import status
+from app.models import User, likes
 
 
 def test_like_post(authorized_client):
@@ -96,3 +99,123 @@ def test_double_like_post(authorized_client):
     response = authorized_client.get(f"/posts/{post['id']}/likes")
     assert response.status_code == status.HTTP_200_OK
     assert len(response.json()) == 0
+
+
+def test_like_counter_follows_toggle(authorized_client):
+    post = authorized_client.post("/posts/", json={"content": "Counted"}).json()
+
+    authorized_client.post(f"/posts/{post['id']}/like")
+    assert authorized_client.get(f"/posts/{post['id']}").json()["likes_count"] == 1
+
+    authorized_client.post(f"/posts/{post['id']}/like")
+    assert authorized_client.get(f"/posts/{post['id']}").json()["likes_count"] == 0
+
+
+def test_put_like_is_idempotent(authorized_client):
+    post = authorized_client.post("/posts/", json={"content": "Likeable"}).json()
+
+    for _ in range(2):
+        response = authorized_client.put(f"/posts/{post['id']}/like")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {
+            "post_id": post["id"],
+            "liked": True,
+            "likes_count": 1,
+        }
+
+    assert len(authorized_client.get(f"/posts/{post['id']}/likes").json()) == 1
+
+
+def test_delete_like_is_idempotent(authorized_client):
+    post = authorized_client.post("/posts/", json={"content": "Likeable"}).json()
+    authorized_client.put(f"/posts/{post['id']}/like")
+
+    for _ in range(2):
+        response = authorized_client.delete(f"/posts/{post['id']}/like")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {
+            "post_id": post["id"],
+            "liked": False,
+            "likes_count": 0,
+        }
+
+
+def test_put_like_nonexistent_post(authorized_client):
+    response = authorized_client.put("/posts/999/like")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json()["detail"] == "Post not found"
+
+    response = authorized_client.delete("/posts/999/like")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_get_likes_pagination(authorized_client, db, test_post):
+    post_id = test_post.id
+    users = [User(user_name=f"fan{i}", email=f"fan{i}@example.com") for i in range(5)]
+    db.add_all(users)
+    db.flush()
+    db.execute(likes.insert(), [{"user_id": u.id, "post_id": post_id} for u in users])
+    db.commit()
+    user_ids = sorted(u.id for u in users)
+
+    seen = []
+    response = authorized_client.get(f"/posts/{post_id}/likes", params={"limit": 2})
+    while True:
+        seen.extend(like["user_id"] for like in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        response = authorized_client.get(
+            f"/posts/{post_id}/likes", params={"limit": 2, "cursor": cursor}
+        )
+
+    assert seen == user_ids
+
+
+def test_get_likes_rejects_bad_cursor(authorized_client, test_post):
+    for raw in (b"[1e400]", b"[1.5]", b"[-1]", b"[9223372036854775808]", b"x"):
+        cursor = base64.urlsafe_b64encode(raw).decode()
+        response = authorized_client.get(
+            f"/posts/{test_post.id}/likes", params={"cursor": cursor}
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_get_likes_count_only(authorized_client):
+    post = authorized_client.post("/posts/", json={"content": "Counted"}).json()
+    authorized_client.put(f"/posts/{post['id']}/like")
+
+    response = authorized_client.get(
+        f"/posts/{post['id']}/likes", params={"count_only": True}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"post_id": post["id"], "likes_count": 1}
+
+    response = authorized_client.get("/posts/999/likes", params={"count_only": True})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_export_likes(authorized_client, other_authorized_client):
+    post = authorized_client.post("/posts/", json={"content": "Exported"}).json()
+    authorized_client.put(f"/posts/{post['id']}/like")
+    other_authorized_client.put(f"/posts/{post['id']}/like")
+
+    response = authorized_client.get(f"/posts/{post['id']}/likes/export")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["post_id"] for row in rows] == [post["id"], post["id"]]
+    assert len({row["user_id"] for row in rows}) == 2
+
+
+def test_export_likes_nonexistent_post(authorized_client):
+    response = authorized_client.get("/posts/999/likes/export")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_like_does_not_touch_post_updated_at(authorized_client):
+    post = authorized_client.post("/posts/", json={"content": "Unchanged"}).json()
+    authorized_client.put(f"/posts/{post['id']}/like")
+    assert authorized_client.get(f"/posts/{post['id']}").json()["updated_at"] == (
+        post["updated_at"]
+    )
@@ -3,9 +3,12 @@ from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from fastapi import UploadFile
 from app.main import app
+from app.config import settings
+from app.schemas import MediaFile
 from unittest.mock import AsyncMock, patch, MagicMock
 import json
-from starlette.websockets import WebSocketDisconnect
+import msgpack
+import os
 
 
 def test_platform_capabilities(client):
@@ -20,7 +23,14 @@ def test_platform_capabilities(client):
 
 def test_upload_file(authorized_client):
     with patch("app.main.save_upload_file", new_callable=AsyncMock) as mock_save:
-        mock_save.return_value = "uploads/1/test.jpg"
+        mock_save.return_value = MediaFile(
+            id=1,
+            filename="test.jpg",
+            sha256="ab" * 32,
+            size=12,
+            location="uploads/blobs/ab/ab/" + "ab" * 32 + ".jpg",
+            url="/media/blobs/ab/ab/" + "ab" * 32 + ".jpg",
+        )
         response = authorized_client.post(
             "/api/upload", files={"file": ("test.jpg", b"test content")}
         )
@@ -44,8 +54,11 @@ async def test_websocket_endpoint(authorized_client, test_user_token):
     mock_user = MagicMock(id=1, user_name="testuser")
 
     # Simulate one message, then disconnect
-    mock_websocket.receive_text = AsyncMock(
-        side_effect=["test message", WebSocketDisconnect()]
+    mock_websocket.receive = AsyncMock(
+        side_effect=[
+            {"type": "websocket.receive", "text": "test message"},
+            {"type": "websocket.disconnect", "code": 1000},
+        ]
     )
 
     with patch("app.main.get_current_user", return_value=mock_user):
@@ -55,15 +68,26 @@ async def test_websocket_endpoint(authorized_client, test_user_token):
             ) as mock_disconnect:
                 with patch(
                     "app.main.manager.broadcast", new_callable=AsyncMock
-                ) as mock_broadcast:
+                ) as mock_broadcast, patch(
+                    "app.main.manager.handle_control_message", new_callable=AsyncMock
+                ) as mock_control:
                     websocket_route = next(
                         route for route in app.routes if route.path == "/ws"
                     )
+                    db = AsyncMock()
                     await websocket_route.endpoint(
-                        mock_websocket, test_user_token, None
+                        mock_websocket, test_user_token, db, "json"
+                    )
+                    # The session is released before the socket starts listening
+                    db.close.assert_awaited_once()
+                    mock_connect.assert_called_once_with(
+                        mock_websocket, mock_user.id, "json"
+                    )
+                    # Inbound messages are control messages, not chat
+                    mock_broadcast.assert_not_called()
+                    mock_control.assert_awaited_once_with(
+                        mock_websocket, mock_user.id, "test message"
                     )
-                    mock_connect.assert_called_once_with(mock_websocket, mock_user.id)
-                    mock_broadcast.assert_called_once()
                     mock_disconnect.assert_called_once_with(
                         mock_websocket, mock_user.id
                     )
@@ -85,10 +109,13 @@ async def test_websocket_endpoint_error_path(authorized_client, test_user_token)
                     websocket_route = next(
                         route for route in app.routes if route.path == "/ws"
                     )
+                    db = AsyncMock()
                     await websocket_route.endpoint(
-                        mock_websocket, test_user_token, None
+                        mock_websocket, test_user_token, db, "json"
                     )
                     mock_websocket.close.assert_awaited()
+                    db.close.assert_awaited_once()
+                    mock_connect.assert_not_called()
 
 
 def test_validation_error_handler(authorized_client):
@@ -103,3 +130,73 @@ def test_validation_error_handler(authorized_client):
         assert "detail" in data
         assert "platform" in data
         assert "error_type" in data
+
+
+def test_upload_rejects_oversized_request(authorized_client, monkeypatch):
+    monkeypatch.setattr(settings, "max_upload_size", 1024)
+    with patch("app.main.save_upload_file", new_callable=AsyncMock) as mock_save:
+        response = authorized_client.post(
+            "/api/upload", files={"file": ("big.jpg", b"0" * (1024 * 1024))}
+        )
+    assert response.status_code == 413
+    mock_save.assert_not_called()
+
+
+def test_upload_and_delete_shared_file(
+    authorized_client, other_authorized_client, upload_dir
+):
+    with open("tests/test_files/test.jpg", "rb") as image:
+        content = image.read()
+    first = authorized_client.post(
+        "/api/upload", files={"file": ("mine.jpg", content)}
+    ).json()
+    second = other_authorized_client.post(
+        "/api/upload", files={"file": ("theirs.jpg", content)}
+    ).json()
+    assert first["location"] == second["location"]
+    assert second["location"].startswith(upload_dir)
+    assert first["id"] != second["id"]
+
+    response = authorized_client.delete(f"/api/upload/{second['id']}")
+    assert response.status_code == 403
+
+    response = authorized_client.delete(f"/api/upload/{first['id']}")
+    assert response.status_code == 200
+    assert os.path.exists(second["location"])
+
+    response = other_authorized_client.delete(f"/api/upload/{second['id']}")
+    assert response.status_code == 200
+    assert not os.path.exists(second["location"])
+
+    response = other_authorized_client.delete(f"/api/upload/{second['id']}")
+    assert response.status_code == 404
+
+
+def test_websocket_subscriptions(client, test_user, test_user_token):
+    with client.websocket_connect(f"/ws?token={test_user_token}") as websocket:
+        websocket.send_text(json.dumps({"action": "subscribe", "topic": "post:1"}))
+        assert websocket.receive_json() == {"type": "subscribed", "topic": "post:1"}
+
+        websocket.send_text(json.dumps({"action": "subscribe", "topic": "user:999"}))
+        reply = websocket.receive_json()
+        assert reply["type"] == "error"
+        assert reply["topic"] == "user:999"
+
+        websocket.send_text(json.dumps({"action": "unsubscribe", "topic": "post:1"}))
+        assert websocket.receive_json() == {"type": "unsubscribed", "topic": "post:1"}
+
+        websocket.send_text("hello everyone")
+        assert websocket.receive_json()["type"] == "error"
+
+
+def test_websocket_msgpack_format(client, test_user_token):
+    with client.websocket_connect(
+        f"/ws?token={test_user_token}&format=msgpack"
+    ) as websocket:
+        websocket.send_bytes(msgpack.packb({"action": "subscribe", "topic": "feed"}))
+        assert msgpack.unpackb(websocket.receive_bytes()) == [
+            {"type": "subscribed", "topic": "feed"}
+        ]
+        # Text control messages still work on binary sockets
+        websocket.send_text(json.dumps({"action": "ping"}))
+        assert msgpack.unpackb(websocket.receive_bytes()) == [{"type": "pong"}]
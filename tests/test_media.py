@@ -0,0 +1,120 @@
+import hashlib
+import os
+import pytest
+from app.config import settings
+from app.media import (
+    MediaFileResponse,
+    RangeNotSatisfiable,
+    media_url,
+    parse_range,
+)
+
+# Not a real video, but the media route only cares about the file name
+VIDEO = b"\x00\x00\x00\x18ftypmp42" + bytes(range(256)) * 40
+
+
+@pytest.fixture
+def media_file(upload_dir):
+    sha256 = hashlib.sha256(VIDEO).hexdigest()
+    path = os.path.join(upload_dir, "blobs", sha256[:2], sha256[2:4], sha256 + ".mp4")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as out_file:
+        out_file.write(VIDEO)
+    return sha256, media_url(path)
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=500-5000", 1000) == (500, 999)
+    assert parse_range("bytes=0-1,5-6", 1000) is None
+    assert parse_range("items=0-1", 1000) is None
+    assert parse_range("bytes=abc", 1000) is None
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=1000-", 1000)
+
+
+def test_serve_media(client, media_file):
+    sha256, url = media_file
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.content == VIDEO
+    assert response.headers["content-type"] == "video/mp4"
+    assert response.headers["etag"] == f'"{sha256}"'
+    assert response.headers["accept-ranges"] == "bytes"
+    assert "immutable" in response.headers["cache-control"]
+    assert "content-encoding" not in response.headers
+
+
+def test_serve_media_range(client, media_file):
+    _, url = media_file
+    response = client.get(url, headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == VIDEO[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(VIDEO)}"
+    assert response.headers["content-length"] == "100"
+
+    response = client.get(url, headers={"Range": "bytes=-10"})
+    assert response.status_code == 206
+    assert response.content == VIDEO[-10:]
+
+    response = client.get(url, headers={"Range": f"bytes={len(VIDEO)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(VIDEO)}"
+
+
+def test_serve_media_if_range_mismatch_sends_everything(client, media_file):
+    _, url = media_file
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == VIDEO
+
+
+def test_serve_media_not_modified(client, media_file):
+    sha256, url = media_file
+    response = client.get(url, headers={"If-None-Match": f'"{sha256}"'})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == f'"{sha256}"'
+
+
+def test_serve_media_head(client, media_file):
+    _, url = media_file
+    response = client.head(url)
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(len(VIDEO))
+    assert response.content == b""
+
+
+def test_serve_media_rejects_other_paths(client, media_file):
+    assert client.get("/media/../app/main.py").status_code == 404
+    assert client.get("/media/tmp/upload.part").status_code == 404
+    assert client.get("/media/blobs/00/00/" + "0" * 64 + ".mp4").status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_media_response_uses_zerocopysend(media_file):
+    sha256, url = media_file
+    path = os.path.join(settings.upload_dir, *url.removeprefix("/media/").split("/"))
+    messages = []
+
+    async def send(message):
+        if message["type"] == "http.response.zerocopysend":
+            message = {**message, "file": message["file"].name}
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": [(b"range", b"bytes=10-19")],
+        "extensions": {"http.response.zerocopysend": {}},
+    }
+    await MediaFileResponse(path)(scope, None, send)
+    assert messages[0]["status"] == 206
+    assert messages[1] == {
+        "type": "http.response.zerocopysend",
+        "file": path,
+        "offset": 10,
+        "count": 10,
+    }
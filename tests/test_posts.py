@@ -1,8 +1,10 @@
 import pytest
 from fastapi import status
+from sqlalchemy import event
 from sqlalchemy.orm import Session
-from app.models import User
+from app.models import User, Post
 from app.auth import get_password_hash
+from app.pagination import _encode, keyset_page
 
 
 def test_create_post(authorized_client):
@@ -123,3 +125,106 @@ def test_delete_post_unauthorized(authorized_client, other_authorized_client):
     response = other_authorized_client.delete(f"/posts/{post['id']}")
     assert response.status_code == status.HTTP_403_FORBIDDEN
     assert response.json()["detail"] == "Not authorized to delete this post"
+
+
+def test_get_posts_cursor_pagination(authorized_client):
+    for i in range(5):
+        authorized_client.post("/posts/", json={"content": f"Post {i}"})
+
+    seen = []
+    response = authorized_client.get("/posts/", params={"limit": 2})
+    while True:
+        assert response.status_code == status.HTTP_200_OK
+        seen.extend(post["content"] for post in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        response = authorized_client.get(
+            "/posts/", params={"limit": 2, "cursor": cursor}
+        )
+
+    assert seen == [f"Post {i}" for i in range(5)]
+
+
+def test_get_posts_skip_still_supported(authorized_client):
+    for i in range(3):
+        authorized_client.post("/posts/", json={"content": f"Post {i}"})
+
+    response = authorized_client.get("/posts/", params={"skip": 1, "limit": 1})
+    assert response.status_code == status.HTTP_200_OK
+    assert [post["content"] for post in response.json()] == ["Post 1"]
+    assert "X-Next-Cursor" in response.headers
+
+
+def test_get_posts_invalid_cursor(authorized_client):
+    response = authorized_client.get("/posts/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_get_posts_rejects_out_of_range_cursor(authorized_client):
+    for row_id in (2**63, -1, 1.5, "1", True):
+        cursor = _encode(["2026-01-01T00:00:00", row_id])
+        response = authorized_client.get("/posts/", params={"cursor": cursor})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_get_posts_rejects_out_of_range_limit(authorized_client, test_post):
+    for limit in (0, -1, 101):
+        response = authorized_client.get("/posts/", params={"limit": limit})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        response = authorized_client.get(
+            f"/posts/{test_post.id}/comments/", params={"limit": limit}
+        )
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_keyset_page_without_rows_to_return(db, test_post):
+    for limit in (0, -1):
+        assert keyset_page(db.query(Post), Post.created_at, Post.id, None, limit) == (
+            [],
+            None,
+        )
+
+
+def test_get_posts_counts(authorized_client, other_authorized_client):
+    post = authorized_client.post("/posts/", json={"content": "Popular"}).json()
+    authorized_client.post("/posts/", json={"content": "Quiet"})
+    authorized_client.post(f"/posts/{post['id']}/like")
+    other_authorized_client.post(f"/posts/{post['id']}/like")
+    authorized_client.post(f"/posts/{post['id']}/comments/", json={"content": "Hi"})
+
+    data = authorized_client.get("/posts/").json()
+    counts = {p["content"]: (p["likes_count"], p["comments_count"]) for p in data}
+    assert counts == {"Popular": (2, 1), "Quiet": (0, 0)}
+
+    detail = authorized_client.get(f"/posts/{post['id']}").json()
+    assert detail["likes_count"] == 2
+    assert detail["comments_count"] == 1
+    assert detail["author"]["user_name"] == "testuser"
+
+
+def test_get_posts_statement_count_is_constant(authorized_client, db):
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    def statements_for_page(limit):
+        statements.clear()
+        authorized_client.get("/posts/", params={"limit": limit})
+        return len(statements)
+
+    for i in range(6):
+        author = User(user_name=f"author{i}", email=f"author{i}@example.com")
+        db.add(author)
+        db.flush()
+        db.add(Post(content=f"Post {i}", author_id=author.id))
+    db.commit()
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        assert statements_for_page(2) == statements_for_page(6)
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
@@ -0,0 +1,102 @@
+from app.models import Post
+
+# Scans that are meant to be there: the feed walks this index newest first
+# and stops at the page size
+ORDERED_SCANS = {
+    "SCAN CONSTANT ROW",
+    "SCAN posts USING INDEX ix_posts_created_at_id",
+}
+
+
+def _full_scans(plans):
+    return [
+        (statement, detail)
+        for statement, details in plans
+        for detail in details
+        if detail.startswith("SCAN ") and detail not in ORDERED_SCANS
+    ]
+
+
+def test_endpoint_queries_use_indexes(
+    authorized_client, other_authorized_client, query_plans, monkeypatch, upload_dir
+):
+    post = authorized_client.post("/posts/", json={"content": "Indexed"}).json()
+    post_id = post["id"]
+    authorized_client.post("/posts/", json={"content": "Another"})
+
+    first_page = authorized_client.get("/posts/", params={"limit": 1})
+    authorized_client.get(
+        "/posts/", params={"limit": 1, "cursor": first_page.headers["X-Next-Cursor"]}
+    )
+    authorized_client.get("/posts/", params={"skip": 1, "limit": 1})
+    authorized_client.get(f"/posts/{post_id}")
+    authorized_client.put(f"/posts/{post_id}", json={"content": "Edited"})
+
+    authorized_client.post(f"/posts/{post_id}/like")
+    other_authorized_client.put(f"/posts/{post_id}/like")
+    authorized_client.post(f"/posts/{post_id}/like")
+    other_authorized_client.delete(f"/posts/{post_id}/like")
+    authorized_client.put(f"/posts/{post_id}/like")
+    authorized_client.get(f"/posts/{post_id}/likes")
+    authorized_client.get(f"/posts/{post_id}/likes", params={"count_only": True})
+    authorized_client.get(f"/posts/{post_id}/likes/export")
+
+    comment = authorized_client.post(
+        f"/posts/{post_id}/comments/", json={"content": "Indexed comment"}
+    ).json()
+    authorized_client.post(f"/posts/{post_id}/comments/", json={"content": "Second"})
+    comments = authorized_client.get(f"/posts/{post_id}/comments/", params={"limit": 1})
+    authorized_client.get(
+        f"/posts/{post_id}/comments/",
+        params={"limit": 1, "cursor": comments.headers["X-Next-Cursor"]},
+    )
+    authorized_client.put(f"/comments/{comment['id']}", json={"content": "Edited"})
+    authorized_client.delete(f"/comments/{comment['id']}")
+
+    authorized_client.get("/users/me/")
+    other_id = other_authorized_client.get("/users/me/").json()["id"]
+    authorized_client.put(f"/users/{other_id}/follow")
+    other_authorized_client.post("/posts/", json={"content": "For followers"})
+    timeline = authorized_client.get("/timeline", params={"limit": 1})
+    authorized_client.get(
+        "/timeline", params={"limit": 1, "cursor": timeline.headers["X-Next-Cursor"]}
+    )
+    # Posts by authors over the fan-out limit are pulled at read time
+    monkeypatch.setattr("app.timeline.settings.timeline_fanout_max_followers", 0)
+    other_authorized_client.post("/posts/", json={"content": "Pulled"})
+    authorized_client.get("/timeline", params={"limit": 1})
+    authorized_client.delete(f"/users/{other_id}/follow")
+    authorized_client.delete(f"/posts/{post_id}")
+
+    with open("tests/test_files/test.jpg", "rb") as image:
+        content = image.read()
+    upload = authorized_client.post(
+        "/api/upload", files={"file": ("indexed.jpg", content)}
+    ).json()
+    other_authorized_client.post("/api/upload", files={"file": ("same.jpg", content)})
+    authorized_client.get(f"/api/upload/{upload['id']}/variants", params={"width": 1})
+    authorized_client.get(
+        f"/api/upload/{upload['id']}/image",
+        params={"width": 1},
+        follow_redirects=False,
+    )
+    authorized_client.get(upload["url"])
+    resumable = authorized_client.post(
+        "/api/upload/resumable", json={"filename": "resumed.jpg", "size": len(content)}
+    ).json()
+    authorized_client.patch(
+        f"/api/upload/resumable/{resumable['id']}",
+        content=content,
+        headers={"Upload-Offset": "0"},
+    )
+    authorized_client.post(f"/api/upload/resumable/{resumable['id']}/complete")
+    authorized_client.delete(f"/api/upload/{upload['id']}")
+    authorized_client.post("/token/revoke")
+
+    assert query_plans
+    assert _full_scans(query_plans) == []
+
+
+def test_full_scan_is_detected(db, query_plans):
+    db.query(Post).filter(Post.content == "unindexed").all()
+    assert _full_scans(query_plans) == [(query_plans[0][0], "SCAN posts")]
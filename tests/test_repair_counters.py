@@ -0,0 +1,34 @@
+from sqlalchemy.orm import Session
+from app.models import User, Post, Comment
+from repair_counters import repair_post_counters
+
+
+def test_repair_post_counters(db: Session):
+    user = User(user_name="counter", email="counter@example.com")
+    db.add(user)
+    db.commit()
+
+    posts = [Post(content=f"Post {i}", author_id=user.id) for i in range(5)]
+    db.add_all(posts)
+    db.commit()
+
+    posts[0].liked_by.append(user)
+    db.add(Comment(content="Hi", author_id=user.id, post_id=posts[0].id))
+    posts[1].likes_count = 7
+    posts[2].comments_count = 3
+    db.commit()
+
+    assert repair_post_counters(db, batch_size=2) == 3
+
+    counts = {p.content: (p.likes_count, p.comments_count) for p in db.query(Post)}
+    assert counts == {f"Post {i}": (0, 0) for i in range(1, 5)} | {"Post 0": (1, 1)}
+
+
+def test_repair_post_counters_nothing_to_fix(db: Session):
+    user = User(user_name="counter", email="counter@example.com")
+    db.add(user)
+    db.commit()
+    db.add(Post(content="Clean", author_id=user.id))
+    db.commit()
+
+    assert repair_post_counters(db) == 0
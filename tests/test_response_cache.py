@@ -0,0 +1,137 @@
+from unittest.mock import MagicMock, patch
+from app.response_cache import (
+    INVALIDATE_TOPIC,
+    CachedResponse,
+    ResponseCache,
+    invalidate_everywhere,
+    response_cache,
+)
+from app.websocket_manager import manager
+
+
+def _entry(size, tags=()):
+    return CachedResponse(b"x" * size, {}, tags)
+
+
+def test_lru_eviction_is_bounded_by_bytes():
+    cache = ResponseCache(max_bytes=100, ttl=60)
+    cache.set("a", _entry(40), cache.version)
+    cache.set("b", _entry(40), cache.version)
+    cache.get("a")
+    cache.set("c", _entry(40), cache.version)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.size == 80
+    assert not cache.set("huge", _entry(101), cache.version)
+
+
+def test_invalidate_drops_tagged_entries():
+    cache = ResponseCache(max_bytes=1000, ttl=60)
+    cache.set("post", _entry(10, ["post:1"]), cache.version)
+    cache.set("page", _entry(10, ["posts", "post:1", "post:2"]), cache.version)
+    cache.set("other", _entry(10, ["post:2"]), cache.version)
+
+    cache.invalidate("post:1")
+    assert cache.get("post") is None
+    assert cache.get("page") is None
+    assert cache.get("other") is not None
+    assert cache.size == 10
+
+
+def test_responses_built_across_an_invalidation_are_not_stored():
+    cache = ResponseCache(max_bytes=1000, ttl=60)
+    version = cache.version
+    cache.invalidate("post:1")
+    assert not cache.set("post", _entry(10, ["post:1"]), version)
+    assert len(cache) == 0
+
+
+def test_post_etag_and_not_modified(authorized_client, test_post):
+    first = authorized_client.get(f"/posts/{test_post.id}")
+    etag = first.headers["etag"]
+    assert first.status_code == 200
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    # Revalidation is answered from the cache without querying
+    with patch("app.main._post_query", side_effect=AssertionError("queried")):
+        second = authorized_client.get(
+            f"/posts/{test_post.id}", headers={"If-None-Match": etag}
+        )
+        third = authorized_client.get(f"/posts/{test_post.id}")
+    assert second.status_code == 304
+    assert second.headers["etag"] == etag
+    assert third.json() == first.json()
+
+
+def test_writes_invalidate_cached_reads(
+    authorized_client, other_authorized_client, test_post
+):
+    post_id = test_post.id
+    etag = authorized_client.get(f"/posts/{post_id}").headers["etag"]
+    authorized_client.get("/posts/")
+    authorized_client.get(f"/posts/{post_id}/comments/")
+
+    other_authorized_client.put(f"/posts/{post_id}/like")
+    response = authorized_client.get(
+        f"/posts/{post_id}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["likes_count"] == 1
+    assert authorized_client.get("/posts/").json()[0]["likes_count"] == 1
+
+    other_authorized_client.post(
+        f"/posts/{post_id}/comments/", json={"content": "Fresh"}
+    )
+    comments = authorized_client.get(f"/posts/{post_id}/comments/").json()
+    assert [comment["content"] for comment in comments] == ["Fresh"]
+
+    authorized_client.put(
+        f"/posts/{post_id}", json={"content": "Edited", "image_url": None}
+    )
+    assert authorized_client.get(f"/posts/{post_id}").json()["content"] == "Edited"
+
+    authorized_client.post("/posts/", json={"content": "Newer"})
+    assert len(authorized_client.get("/posts/").json()) == 2
+
+
+def test_missing_post_is_not_cached(authorized_client):
+    assert authorized_client.get("/posts/999").status_code == 404
+    assert len(response_cache) == 0
+
+
+def test_unrelated_invalidations_do_not_block_storing():
+    cache = ResponseCache(max_bytes=1000, ttl=60, max_tags=2)
+    version = cache.version
+    cache.invalidate("post:2")
+    assert cache.set("post", _entry(10, ["post:1"]), version)
+
+    # Once stamps are forgotten, older builds are refused to be safe
+    cache.invalidate("post:3", "post:4")
+    assert not cache.set("post", _entry(10, ["post:1"]), version)
+    assert cache.set("post", _entry(10, ["post:1"]), cache.version)
+
+
+def test_invalidations_are_relayed_between_workers(monkeypatch):
+    relayed = MagicMock()
+    monkeypatch.setattr("app.response_cache.event_bus.relay", relayed)
+    response_cache.set("post", _entry(10, ["post:1"]), response_cache.version)
+
+    invalidate_everywhere("post:1")
+    relayed.assert_called_once_with(INVALIDATE_TOPIC, '["post:1"]')
+
+    # What another worker does when the relayed message arrives
+    response_cache.set("post", _entry(10, ["post:1"]), response_cache.version)
+    assert manager.deliver(INVALIDATE_TOPIC, '["post:1"]') == 0
+    assert response_cache.get("post") is None
+
+
+def test_recent_writers_bypass_the_cache(authorized_client, test_post):
+    post_id = test_post.id
+    stale = CachedResponse(b'{"content": "stale"}', {}, [])
+    response_cache.set(("post", post_id), stale, response_cache.version)
+    assert authorized_client.get(f"/posts/{post_id}").json()["content"] == "stale"
+
+    authorized_client.post("/posts/", json={"content": "Another"})
+    response = authorized_client.get(f"/posts/{post_id}")
+    assert response.json()["content"] == "Test post content"
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import time
+import pytest
+from starlette.requests import ClientDisconnect
+from app.resumable_uploads import (
+    _meta_path,
+    _part_path,
+    append_chunk,
+    collect_expired_uploads,
+    create_upload,
+    get_upload,
+)
+
+# Sessions and completed blobs live under a temporary uploads dir
+pytestmark = pytest.mark.usefixtures("upload_dir")
+
+
+@pytest.fixture
+def image_bytes():
+    with open("tests/test_files/test.jpg", "rb") as image:
+        return image.read()
+
+
+def _create(client, size, filename="clip.jpg"):
+    response = client.post(
+        "/api/upload/resumable", json={"filename": filename, "size": size}
+    )
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def _patch(client, upload_id, offset, body):
+    return client.patch(
+        f"/api/upload/resumable/{upload_id}",
+        content=body,
+        headers={"Upload-Offset": str(offset)},
+    )
+
+
+def test_resumable_upload_flow(authorized_client, image_bytes):
+    upload_id = _create(authorized_client, len(image_bytes))
+    response = authorized_client.head(f"/api/upload/resumable/{upload_id}")
+    assert response.status_code == 200
+    assert response.headers["upload-offset"] == "0"
+    assert response.headers["upload-length"] == str(len(image_bytes))
+
+    half = len(image_bytes) // 2
+    response = _patch(authorized_client, upload_id, 0, image_bytes[:half])
+    assert response.status_code == 204
+    assert response.headers["upload-offset"] == str(half)
+
+    # A retry of an already stored chunk is refused with the real offset
+    response = _patch(authorized_client, upload_id, 0, image_bytes[:half])
+    assert response.status_code == 409
+    assert response.headers["upload-offset"] == str(half)
+
+    response = authorized_client.post(f"/api/upload/resumable/{upload_id}/complete")
+    assert response.status_code == 409
+
+    response = _patch(authorized_client, upload_id, half, image_bytes[half:])
+    assert response.status_code == 204
+
+    response = authorized_client.post(f"/api/upload/resumable/{upload_id}/complete")
+    assert response.status_code == 200
+    stored = response.json()
+    assert stored["sha256"] == hashlib.sha256(image_bytes).hexdigest()
+    assert stored["filename"] == "clip.jpg"
+    with open(stored["location"], "rb") as saved:
+        assert saved.read() == image_bytes
+    # Variants are rendered after the response, in a session of their own
+    response = authorized_client.get(f"/api/upload/{stored['id']}/variants")
+    assert response.json()["status"] == "ready"
+
+    response = authorized_client.get(f"/api/upload/resumable/{upload_id}")
+    assert response.status_code == 404
+    authorized_client.delete(f"/api/upload/{stored['id']}")
+
+
+def test_resumable_upload_rejects_overflow(authorized_client):
+    upload_id = _create(authorized_client, 10)
+    response = _patch(authorized_client, upload_id, 0, b"x" * 11)
+    assert response.status_code == 409
+    assert response.headers["upload-offset"] == "0"
+
+
+def test_resumable_upload_validates_content(authorized_client):
+    upload_id = _create(authorized_client, 20)
+    response = _patch(authorized_client, upload_id, 0, b"not an image at all!")
+    assert response.status_code == 204
+    response = authorized_client.post(f"/api/upload/resumable/{upload_id}/complete")
+    assert response.status_code == 400
+    assert not os.path.exists(_part_path(upload_id))
+    assert not os.path.exists(_meta_path(upload_id))
+
+
+def test_resumable_upload_create_checks(authorized_client):
+    response = authorized_client.post(
+        "/api/upload/resumable", json={"filename": "notes.txt", "size": 10}
+    )
+    assert response.status_code == 400
+    response = authorized_client.post(
+        "/api/upload/resumable", json={"filename": "big.mp4", "size": 10**12}
+    )
+    assert response.status_code == 413
+
+
+def test_resumable_upload_is_private(authorized_client, other_authorized_client):
+    upload_id = _create(authorized_client, 10)
+    response = other_authorized_client.get(f"/api/upload/resumable/{upload_id}")
+    assert response.status_code == 404
+    assert _patch(other_authorized_client, upload_id, 0, b"x").status_code == 404
+
+    response = authorized_client.delete(f"/api/upload/resumable/{upload_id}")
+    assert response.status_code == 200
+    assert not os.path.exists(_part_path(upload_id))
+
+
+@pytest.mark.asyncio
+async def test_interrupted_chunk_keeps_received_bytes():
+    session = create_upload(1, "clip.mp4", 100)
+
+    async def dropped_body():
+        yield b"a" * 30
+        raise ClientDisconnect()
+
+    assert await append_chunk(session.id, 1, 0, dropped_body()) == 30
+    assert get_upload(session.id, 1).offset == 30
+
+
+def test_collect_expired_uploads():
+    stale = create_upload(1, "old.mp4", 100)
+    fresh = create_upload(1, "new.mp4", 100)
+    long_ago = time.time() - 2 * 24 * 60 * 60
+    for path in (_part_path(stale.id), _meta_path(stale.id)):
+        os.utime(path, (long_ago, long_ago))
+
+    assert collect_expired_uploads() == 1
+    assert not os.path.exists(_part_path(stale.id))
+    assert os.path.exists(_part_path(fresh.id))
@@ -0,0 +1,129 @@
+from app.models import User, timeline
+from app.timeline import follow, unfollow
+
+
+def _post(client, content):
+    return client.post("/posts/", json={"content": content}).json()["id"]
+
+
+def _timeline(client, **params):
+    return [post["content"] for post in client.get("/timeline", params=params).json()]
+
+
+def test_follow_and_unfollow(authorized_client, other_authorized_client, test_user):
+    user_id = test_user.id
+    response = other_authorized_client.put(f"/users/{user_id}/follow")
+    assert response.json() == {
+        "user_id": user_id,
+        "following": True,
+        "followers_count": 1,
+    }
+    # Following twice is a no-op
+    response = other_authorized_client.put(f"/users/{user_id}/follow")
+    assert response.json()["followers_count"] == 1
+
+    response = other_authorized_client.delete(f"/users/{user_id}/follow")
+    assert response.json()["followers_count"] == 0
+    response = other_authorized_client.delete(f"/users/{user_id}/follow")
+    assert response.json()["followers_count"] == 0
+
+    assert authorized_client.put(f"/users/{user_id}/follow").status_code == 400
+    assert authorized_client.put("/users/999/follow").status_code == 404
+
+
+def test_posts_fan_out_to_followers(
+    authorized_client, other_authorized_client, test_user, db
+):
+    user_id = test_user.id
+    other_authorized_client.put(f"/users/{user_id}/follow")
+    _post(authorized_client, "Hello followers")
+    _post(other_authorized_client, "Own post")
+
+    assert _timeline(other_authorized_client) == ["Own post", "Hello followers"]
+    assert _timeline(authorized_client) == ["Hello followers"]
+    assert db.query(timeline).count() == 3
+
+    other_authorized_client.delete(f"/users/{user_id}/follow")
+    assert _timeline(other_authorized_client) == ["Own post"]
+
+
+def test_follow_backfills_recent_posts(
+    authorized_client, other_authorized_client, test_user, monkeypatch
+):
+    user_id = test_user.id
+    monkeypatch.setattr("app.timeline.settings.timeline_backfill_posts", 2)
+    for i in range(3):
+        _post(authorized_client, f"Post {i}")
+
+    other_authorized_client.put(f"/users/{user_id}/follow")
+    assert _timeline(other_authorized_client) == ["Post 2", "Post 1"]
+
+
+def test_timeline_pages_newest_first(authorized_client):
+    for i in range(5):
+        _post(authorized_client, f"Post {i}")
+
+    first = authorized_client.get("/timeline", params={"limit": 2})
+    cursor = first.headers["X-Next-Cursor"]
+    assert [post["content"] for post in first.json()] == ["Post 4", "Post 3"]
+    second = authorized_client.get("/timeline", params={"limit": 2, "cursor": cursor})
+    assert [post["content"] for post in second.json()] == ["Post 2", "Post 1"]
+    last = authorized_client.get(
+        "/timeline", params={"limit": 2, "cursor": second.headers["X-Next-Cursor"]}
+    )
+    assert [post["content"] for post in last.json()] == ["Post 0"]
+    assert "X-Next-Cursor" not in last.headers
+
+
+def test_popular_authors_are_pulled_at_read_time(
+    authorized_client, other_authorized_client, test_user, db, monkeypatch
+):
+    user_id = test_user.id
+    other_authorized_client.put(f"/users/{user_id}/follow")
+    _post(authorized_client, "Fanned out")
+    monkeypatch.setattr("app.timeline.settings.timeline_fanout_max_followers", 0)
+    _post(authorized_client, "Pulled")
+    _post(other_authorized_client, "Own post")
+
+    # Only the author's own row was written for the second post
+    assert db.query(timeline).count() == 4
+    assert _timeline(other_authorized_client) == ["Own post", "Pulled", "Fanned out"]
+    first = other_authorized_client.get("/timeline", params={"limit": 2})
+    second = other_authorized_client.get(
+        "/timeline", params={"limit": 2, "cursor": first.headers["X-Next-Cursor"]}
+    )
+    pages = [post["content"] for post in first.json() + second.json()]
+    assert pages == ["Own post", "Pulled", "Fanned out"]
+
+
+def test_pulled_posts_are_kept_when_author_falls_under_limit(
+    authorized_client, other_authorized_client, test_user, db, monkeypatch
+):
+    user_id = test_user.id
+    monkeypatch.setattr("app.timeline.settings.timeline_fanout_max_followers", 1)
+    other_authorized_client.put(f"/users/{user_id}/follow")
+    third = User(user_name="third", email="third@example.com", password_hash="x")
+    db.add(third)
+    db.commit()
+    third_id = third.id
+    follow(db, third_id, user_id)
+    db.commit()
+
+    _post(authorized_client, "Pulled")
+    assert _timeline(other_authorized_client) == ["Pulled"]
+    unfollow(db, third_id, user_id)
+    db.commit()
+    # Fanned out again, so the post written while pulled must be copied in
+    assert _timeline(other_authorized_client) == ["Pulled"]
+
+
+def test_deleted_posts_leave_timelines(
+    authorized_client, other_authorized_client, test_user, db
+):
+    user_id = test_user.id
+    other_authorized_client.put(f"/users/{user_id}/follow")
+    post_id = _post(authorized_client, "Short lived")
+    authorized_client.delete(f"/posts/{post_id}")
+
+    assert _timeline(other_authorized_client) == []
+    assert db.query(timeline).count() == 0
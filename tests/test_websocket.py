@@ -1,6 +1,16 @@
+import asyncio
+import json
+import msgpack
 import pytest
+import pytest_asyncio
 from fastapi import WebSocket
-from app.websocket_manager import ConnectionManager
+from app.metrics import metrics
+from app.websocket_manager import (
+    ConnectionManager,
+    OutboundMessage,
+    pack_batch,
+    topic_error,
+)
 from unittest.mock import AsyncMock, MagicMock
 
 
@@ -10,9 +20,24 @@ def mock_websocket():
     return websocket
 
 
-@pytest.fixture
-def connection_manager():
-    return ConnectionManager()
+@pytest_asyncio.fixture
+async def connection_manager():
+    manager = ConnectionManager()
+    yield manager
+    for user_id, websockets in list(manager.active_connections.items()):
+        for websocket in list(websockets):
+            await manager.disconnect(websocket, user_id)
+
+
+async def _stall(message):
+    await asyncio.Event().wait()
+
+
+def _blocking_websocket():
+    """A socket whose sends never complete, like a stalled mobile client."""
+    websocket = AsyncMock(spec=WebSocket)
+    websocket.send_text.side_effect = _stall
+    return websocket
 
 
 @pytest.mark.asyncio
@@ -38,6 +63,7 @@ async def test_send_personal_message(connection_manager, mock_websocket):
     message = "Test message"
     await connection_manager.connect(mock_websocket, user_id)
     await connection_manager.send_personal_message(message, user_id)
+    await connection_manager.drain()
     mock_websocket.send_text.assert_called_once_with(message)
 
 
@@ -51,6 +77,251 @@ async def test_broadcast(connection_manager):
     await connection_manager.connect(user2_websocket, 2)
 
     await connection_manager.broadcast(message)
+    await connection_manager.drain()
 
     user1_websocket.send_text.assert_called_once_with(message)
     user2_websocket.send_text.assert_called_once_with(message)
+
+
+@pytest.mark.asyncio
+async def test_broadcast_does_not_wait_for_slow_clients(connection_manager):
+    slow = _blocking_websocket()
+    fast = AsyncMock(spec=WebSocket)
+    await connection_manager.connect(slow, 1)
+    await connection_manager.connect(fast, 2)
+
+    await asyncio.wait_for(connection_manager.broadcast("hello"), timeout=1)
+    await asyncio.sleep(0)
+    fast.send_text.assert_awaited_once_with("hello")
+
+
+@pytest.mark.asyncio
+async def test_failed_send_only_drops_that_socket(connection_manager):
+    broken = AsyncMock(spec=WebSocket)
+    broken.send_text.side_effect = RuntimeError("connection reset")
+    healthy = AsyncMock(spec=WebSocket)
+    await connection_manager.connect(broken, 1)
+    await connection_manager.connect(healthy, 2)
+
+    await connection_manager.broadcast("first")
+    await connection_manager.drain()
+    await connection_manager.broadcast("second")
+    await connection_manager.drain()
+
+    assert 1 not in connection_manager.active_connections
+    assert [call.args[0] for call in healthy.send_text.await_args_list] == [
+        "first",
+        "second",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_is_disconnected():
+    metrics.reset()
+    manager = ConnectionManager(max_queue_size=2, overflow_policy="disconnect")
+    slow = _blocking_websocket()
+    await manager.connect(slow, 1)
+
+    # One message is stuck in send_text, two fill the queue, one overflows
+    for i in range(4):
+        await manager.broadcast(f"message {i}")
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    assert 1 not in manager.active_connections
+    slow.close.assert_awaited_once()
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["websocket.dropped_messages"] == 1
+    assert snapshot["counters"]["websocket.slow_consumers_disconnected"] == 1
+    assert snapshot["gauges"]["websocket.queued_messages"] == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_drop_policy_keeps_connection(connection_manager):
+    connection_manager.max_queue_size = 1
+    connection_manager.overflow_policy = "drop"
+    slow = _blocking_websocket()
+    await connection_manager.connect(slow, 1)
+
+    for i in range(4):
+        await connection_manager.broadcast(f"message {i}")
+        await asyncio.sleep(0)
+
+    assert slow in connection_manager.active_connections[1]
+    slow.close.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_publish_reaches_only_subscribers(connection_manager):
+    subscriber = AsyncMock(spec=WebSocket)
+    bystander = AsyncMock(spec=WebSocket)
+    await connection_manager.connect(subscriber, 1)
+    await connection_manager.connect(bystander, 2)
+    assert connection_manager.subscribe(subscriber, "post:7")
+
+    assert connection_manager.publish("post:7", "new comment") == 1
+    await connection_manager.drain()
+    subscriber.send_text.assert_awaited_once_with("new comment")
+    bystander.send_text.assert_not_awaited()
+
+    connection_manager.unsubscribe(subscriber, "post:7")
+    assert "post:7" not in connection_manager.topics
+    assert connection_manager.publish("post:7", "another") == 0
+
+
+@pytest.mark.asyncio
+async def test_disconnect_leaves_topics(connection_manager, mock_websocket):
+    await connection_manager.connect(mock_websocket, 1)
+    connection_manager.subscribe(mock_websocket, "feed")
+    assert set(connection_manager.topics) == {"user:1", "feed"}
+    await connection_manager.disconnect(mock_websocket, 1)
+    assert connection_manager.topics == {}
+
+
+@pytest.mark.asyncio
+async def test_subscription_limit(connection_manager, mock_websocket, monkeypatch):
+    monkeypatch.setattr("app.websocket_manager.settings.websocket_max_subscriptions", 2)
+    await connection_manager.connect(mock_websocket, 1)
+    assert connection_manager.subscribe(mock_websocket, "post:1")
+    assert not connection_manager.subscribe(mock_websocket, "post:2")
+
+
+def test_topic_error():
+    assert topic_error("post:12", 1) is None
+    assert topic_error("feed", 1) is None
+    assert topic_error("user:1", 1) is None
+    assert topic_error("user:2", 1) is not None
+    assert topic_error("posts", 1) is not None
+    assert topic_error(["post:1"], 1) is not None
+
+
+@pytest.mark.asyncio
+async def test_sweep_pings_and_closes_idle_sockets(connection_manager):
+    metrics.reset()
+    connection_manager.idle_timeout = 60
+    active = AsyncMock(spec=WebSocket)
+    idle = AsyncMock(spec=WebSocket)
+    await connection_manager.connect(active, 1)
+    await connection_manager.connect(idle, 2)
+    now = connection_manager._connections[active].last_seen + 30
+    connection_manager._connections[idle].last_seen = now - 61
+
+    assert connection_manager.sweep(now) == 1
+    await connection_manager.drain()
+    await asyncio.sleep(0.01)
+
+    active.send_text.assert_awaited_once_with('{"type": "ping"}')
+    idle.close.assert_awaited_once_with(code=1001)
+    assert list(connection_manager.active_connections) == [1]
+    assert metrics.snapshot()["counters"]["websocket.idle_disconnected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_control_messages_count_as_activity(connection_manager, mock_websocket):
+    await connection_manager.connect(mock_websocket, 1)
+    connection = connection_manager._connections[mock_websocket]
+    connection.last_seen = 0
+
+    await connection_manager.handle_control_message(
+        mock_websocket, 1, '{"action": "pong"}'
+    )
+    assert connection.last_seen > 0
+    await connection_manager.handle_control_message(
+        mock_websocket, 1, '{"action": "ping"}'
+    )
+    await connection_manager.drain()
+    mock_websocket.send_text.assert_awaited_once_with('{"type": "pong"}')
+
+
+@pytest.mark.asyncio
+async def test_oldest_socket_is_evicted_over_per_user_limit(connection_manager):
+    connection_manager.max_connections_per_user = 2
+    websockets = [AsyncMock(spec=WebSocket) for _ in range(3)]
+    for websocket in websockets:
+        await connection_manager.connect(websocket, 1)
+    await asyncio.sleep(0.01)
+
+    assert connection_manager.active_connections[1] == websockets[1:]
+    websockets[0].close.assert_awaited_once_with(code=1008)
+    assert len(connection_manager._connections) == 2
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_runs_while_started():
+    manager = ConnectionManager(ping_interval=0.01, idle_timeout=0.02)
+    websocket = AsyncMock(spec=WebSocket)
+    await manager.start()
+    try:
+        await manager.connect(websocket, 1)
+        for _ in range(20):
+            await asyncio.sleep(0.01)
+    finally:
+        await manager.stop()
+
+    assert manager.active_connections == {}
+    websocket.close.assert_awaited_once_with(code=1001)
+
+
+@pytest.mark.asyncio
+async def test_msgpack_sockets_get_batched_frames(connection_manager):
+    connection_manager.batch_window = 0.01
+    binary = AsyncMock(spec=WebSocket)
+    text = AsyncMock(spec=WebSocket)
+    await connection_manager.connect(binary, 1, "msgpack")
+    await connection_manager.connect(text, 2)
+    for topic_owner in (binary, text):
+        connection_manager.subscribe(topic_owner, "feed")
+
+    for i in range(3):
+        connection_manager.publish("feed", json.dumps({"n": i}))
+    await connection_manager.drain()
+
+    binary.send_bytes.assert_awaited_once()
+    frame = binary.send_bytes.await_args.args[0]
+    assert msgpack.unpackb(frame) == [{"n": 0}, {"n": 1}, {"n": 2}]
+    # JSON clients keep one message per text frame
+    assert [call.args[0] for call in text.send_text.await_args_list] == [
+        '{"n": 0}',
+        '{"n": 1}',
+        '{"n": 2}',
+    ]
+
+
+@pytest.mark.asyncio
+async def test_broadcast_is_encoded_once(connection_manager, monkeypatch):
+    packb = MagicMock(wraps=msgpack.packb)
+    monkeypatch.setattr("app.websocket_manager.msgpack.packb", packb)
+    websockets = [AsyncMock(spec=WebSocket) for _ in range(5)]
+    for user_id, websocket in enumerate(websockets):
+        await connection_manager.connect(websocket, user_id, "msgpack")
+
+    await connection_manager.broadcast('{"type": "event"}')
+    await connection_manager.drain()
+
+    packb.assert_called_once_with({"type": "event"})
+    for websocket in websockets:
+        websocket.send_bytes.assert_awaited_once()
+
+
+def test_pack_batch_matches_msgpack():
+    for count in (1, 15, 16, 70000):
+        messages = [OutboundMessage(f'{{"n": {i}}}') for i in range(count)]
+        expected = msgpack.packb([{"n": i} for i in range(count)])
+        assert pack_batch(messages) == expected
+
+
+@pytest.mark.asyncio
+async def test_non_string_topics_are_rejected(connection_manager, mock_websocket):
+    await connection_manager.connect(mock_websocket, 1)
+    for action in ("subscribe", "unsubscribe"):
+        await connection_manager.handle_control_message(
+            mock_websocket, 1, json.dumps({"action": action, "topic": {}})
+        )
+    await connection_manager.drain()
+
+    replies = [
+        json.loads(call.args[0]) for call in mock_websocket.send_text.await_args_list
+    ]
+    assert [reply["type"] for reply in replies] == ["error", "error"]
+    assert all(reply["detail"] == "Unknown topic" for reply in replies)
+    assert set(connection_manager.topics) == {"user:1"}